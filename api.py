@@ -1,15 +1,40 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Path, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from typing import List, Optional, Dict
-from pydantic import BaseModel
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Annotated, Generic, List, Optional, TypeVar
+from pydantic import BaseModel, Field
+import orjson
 import os
+import asyncio
+import base64
+import csv
+import hashlib
+import io
+import json
+import re
+import select
 import logging
+import threading
+import time
+from collections import OrderedDict
 
-logger = logging.getLogger(__name__)
+# Columnar response formats are optional; without their package a request
+# for them is answered with 406
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
 
-app = FastAPI(title="nuScenes API")
+logger = logging.getLogger(__name__)
 
 # Database connection settings
 DB_HOST = os.getenv('DB_HOST')
@@ -18,6 +43,557 @@ DB_NAME = os.getenv('DB_NAME')
 DB_USER = os.getenv('DB_USER')
 DB_PASSWORD = os.getenv('DB_PASSWORD')
 
+# Connection pool bounds, seconds a request waits for a free connection,
+# and idle seconds after which a connection is pinged before it is reused
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+DB_POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', '30'))
+# Threads running queries; every one of them holds a connection, so more
+# than DB_POOL_MAX would sit idle
+DB_WORKERS = int(os.getenv('DB_WORKERS', str(DB_POOL_MAX)))
+
+# Rows per page of the list endpoints when no limit is given, and the most
+# a client may ask for
+DEFAULT_PAGE_SIZE = int(os.getenv('DEFAULT_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '1000'))
+# Rows fetched from the server-side cursor per chunk of a streamed response
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '1000'))
+# Most tokens one POST /<resource>/batch request may resolve
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '1000'))
+# Most records a prev/next chain walk follows (guards against cyclic links)
+MAX_CHAIN_LENGTH = int(os.getenv('MAX_CHAIN_LENGTH', '100000'))
+
+# Responses of the reference tables cached per process: number of entries
+# (0 disables the cache) and seconds before an entry is rebuilt anyway
+CACHE_SIZE = int(os.getenv('CACHE_SIZE', '1024'))
+CACHE_TTL = float(os.getenv('CACHE_TTL', '300'))
+
+# Dataset version served when a request does not pick one
+DEFAULT_VERSION = os.getenv('NUSCENES_VERSION', 'v1.0-mini')
+
+# Tokens are stored as uuid; return them in the 32 hex digit nuScenes form
+def uuid_as_hex(value, cursor):
+    return value.replace('-', '') if value is not None else None
+
+UUID_HEX = psycopg2.extensions.new_type((2950,), 'UUID_HEX', uuid_as_hex)
+psycopg2.extensions.register_type(UUID_HEX)
+psycopg2.extensions.register_type(psycopg2.extensions.new_array_type((2951,), 'UUID_HEX[]', UUID_HEX))
+
+# Path token of the uuid-keyed tables; anything else is rejected with 422
+# instead of reaching the database
+TOKEN_PATTERN = r'^[0-9a-fA-F]{32}$'
+Token = Annotated[str, Path(pattern=TOKEN_PATTERN, description="32 hex digit token")]
+# Optional foreign-key filter of a list endpoint
+TokenFilter = Annotated[Optional[str], Query(pattern=TOKEN_PATTERN)]
+TimestampFrom = Annotated[Optional[int], Query(description="Only rows with timestamp >= this (microseconds)")]
+TimestampTo = Annotated[Optional[int], Query(description="Only rows with timestamp <= this (microseconds)")]
+# Filters on values of the list endpoints; each maps to a fixed predicate,
+# so only these columns can be filtered on
+Channel = Annotated[Optional[str], Query(pattern=r'^\w+$', description="Sensor channel, e.g. CAM_FRONT")]
+Modality = Annotated[Optional[str], Query(pattern="^(camera|lidar|radar)$", description="Sensor modality")]
+CategoryName = Annotated[Optional[str], Query(pattern=r'^[\w.]+$',
+                                              description="Category name or parent, e.g. vehicle.car or vehicle")]
+Location = Annotated[Optional[str], Query(pattern=r'^[\w.-]+$', description="Log location, e.g. boston-seaport")]
+VisibilityLevel = Annotated[Optional[str], Query(pattern=r'^[\w-]+$', description="Visibility level, e.g. v80-100")]
+KeyFrame = Annotated[Optional[bool], Query(description="Only keyframes (true) or only sweeps (false)")]
+MinPoints = Annotated[Optional[int], Query(ge=0, description="Only annotations with at least this many points")]
+ChainLimit = Annotated[Optional[int], Query(ge=1, le=MAX_CHAIN_LENGTH, description="Return at most this many records")]
+
+# Map frame x/y of annotations and ego poses; matches the GiST expression
+# index of migrations.py, so spatial queries must use it verbatim
+POSITION = "point(translation[1], translation[2])"
+X = Annotated[float, Query(description="Map frame x (meters)")]
+Y = Annotated[float, Query(description="Map frame y (meters)")]
+Radius = Annotated[float, Query(gt=0, description="Search radius (meters)")]
+Nearest = Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE, description="Number of nearest rows")]
+SpatialLimit = Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE, description="Return at most this many rows")]
+# Every location has its own map frame and their x/y ranges overlap, so a
+# spatial query covers the rows of one location only
+MapLocation = Annotated[str, Query(pattern=r'^[\w.-]+$', description="Log location of the map frame, e.g. boston-seaport")]
+
+VISIBILITY_PATTERN = r'^\w+$'
+Limit = Annotated[Optional[int], Query(ge=1, le=MAX_PAGE_SIZE,
+                                       description=f"Rows per page (default {DEFAULT_PAGE_SIZE}, all rows when streaming)")]
+Cursor = Annotated[Optional[str], Query(description="X-Next-Cursor header of the previous page")]
+# Streamed formats of the list endpoints, picked with ?format= or the Accept header
+STREAM_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# Paged formats: rows as a JSON array, or columnar ({column: [values]})
+PAGE_TYPES = {"json": "application/json", "msgpack": "application/msgpack",
+              "arrow": "application/vnd.apache.arrow.stream"}
+Format = Annotated[Optional[str], Query(pattern="^(json|ndjson|csv|msgpack|arrow)$",
+                                        description="json/msgpack/arrow pages, or ndjson/csv streams of every matching row")]
+
+# WHERE clause on the dataset version plus every (condition, value) pair
+# whose value was given; the filtered columns are indexed (see migrations.py)
+def where(version, *conditions):
+    """AND the (condition, value) pairs whose value is not None; a tuple
+    value fills several placeholders of its condition."""
+    clauses, params = ["dataset_version = %s"], [version]
+    for condition, value in conditions:
+        if value is not None:
+            clauses.append(condition)
+            params.extend(value if isinstance(value, tuple) else (value,))
+    return " AND ".join(clauses), params
+
+def exists(subquery, *conditions):
+    """One EXISTS over subquery for all of the given conditions that apply,
+    as a where() condition."""
+    conditions = [(condition, value) for condition, value in conditions if value is not None]
+    if not conditions:
+        return None, None
+    return (f"EXISTS ({subquery} AND {' AND '.join(condition for condition, _ in conditions)})",
+            tuple(value for _, value in conditions))
+
+# Filters on columns of a referenced table, as EXISTS semi-joins on the
+# same dataset version; the referencing columns are indexed (see migrations.py)
+SCENE_LOG = "SELECT 1 FROM log l WHERE l.dataset_version = scenes.dataset_version AND l.token = scenes.log_token"
+INSTANCE_CATEGORY = """SELECT 1 FROM category c
+    WHERE c.dataset_version = instance.dataset_version AND c.token = instance.category_token"""
+CALIBRATED_SENSOR_SENSOR = """SELECT 1 FROM sensor se
+    WHERE se.dataset_version = calibrated_sensor.dataset_version AND se.token = calibrated_sensor.sensor_token"""
+SAMPLE_DATA_SENSOR = """SELECT 1 FROM calibrated_sensor cs
+    JOIN sensor se ON se.dataset_version = cs.dataset_version AND se.token = cs.sensor_token
+    WHERE cs.dataset_version = sample_data.dataset_version AND cs.token = sample_data.calibrated_sensor_token"""
+ANNOTATION_SAMPLE = """SELECT 1 FROM sample s
+    WHERE s.dataset_version = sample_annotation.dataset_version AND s.token = sample_annotation.sample_token"""
+ANNOTATION_CATEGORY = """SELECT 1 FROM instance i
+    JOIN category c ON c.dataset_version = i.dataset_version AND c.token = i.category_token
+    WHERE i.dataset_version = sample_annotation.dataset_version AND i.token = sample_annotation.instance_token"""
+# Levels are unique, so this is one token and the page is a range of
+# sample_annotation_visibility_page_idx
+ANNOTATION_VISIBILITY = "visibility_token = (SELECT token FROM visibility WHERE dataset_version = %s AND level = %s)"
+# A category matches its own name and every name below it
+CATEGORY_MATCH = "starts_with(c.name || '.', %s || '.')"
+
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool:
+    """Bounded pool of database connections shared by all requests.
+
+    At most ``maxconn`` connections exist. Callers wait for a free one on
+    the event loop (Database.claim, up to ``timeout`` seconds) before they
+    call getconn in a worker thread, so the thread does not wait for a
+    connection to be returned. Returned connections stay
+    open (psycopg2's own pools close everything above ``minconn``), and
+    one that sat idle for more than ``ping_after`` seconds is checked with
+    ``SELECT 1`` and replaced if the server dropped it.
+    """
+
+    def __init__(self, minconn, maxconn, timeout, ping_after, **kwargs):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._kwargs = kwargs
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        # (connection, returned at), most recently returned last
+        self._idle = [(psycopg2.connect(**kwargs), time.monotonic()) for _ in range(minconn)]
+        self.in_use = 0
+        self.opened = minconn
+        self.acquired = 0
+        self.timeouts = 0
+        self.replaced = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _healthy(self, conn, returned):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned < self.ping_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"No database connection free after {self.timeout}s")
+        try:
+            with self._lock:
+                conn, returned = self._idle.pop() if self._idle else (None, None)
+            if conn is not None and not self._healthy(conn, returned):
+                conn.close()
+                conn = None
+                with self._lock:
+                    self.replaced += 1
+            if conn is None:
+                conn = psycopg2.connect(**self._kwargs)
+                with self._lock:
+                    self.opened += 1
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.in_use += 1
+            self.acquired += 1
+        return conn
+
+    def record_wait(self, waited, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+    def putconn(self, conn):
+        # End the request's transaction so the connection does not sit idle in it
+        try:
+            if not conn.closed:
+                conn.rollback()
+        except psycopg2.Error:
+            conn.close()
+        with self._lock:
+            if not conn.closed:
+                self._idle.append((conn, time.monotonic()))
+            self.in_use -= 1
+        self._slots.release()
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max": self.maxconn,
+                "in_use": self.in_use,
+                "idle": len(self._idle),
+                "utilization": round(self.in_use / self.maxconn, 3),
+                "opened": self.opened,
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "replaced": self.replaced,
+                "avg_wait_ms": round(1000 * self.wait_total / self.acquired, 3) if self.acquired else 0.0,
+                "max_wait_ms": round(1000 * self.wait_max, 3),
+            }
+
+def _fetch(conn, query, params, many):
+    cur = conn.cursor()
+    try:
+        cur.execute(query, params)
+        return cur.fetchall() if many else cur.fetchone()
+    finally:
+        cur.close()
+
+def _next_chunk(cur, batch_size, encode, first):
+    rows = cur.fetchmany(batch_size)
+    return encode(rows, first) if rows else None
+
+def _close_stream(pool, conn, cur):
+    try:
+        if cur is not None:
+            cur.close()
+    except psycopg2.Error:
+        pass
+    pool.putconn(conn)
+
+def _begin_snapshot(pool):
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+    except Exception:
+        pool.putconn(conn)
+        raise
+    return conn
+
+def _open_cursor(conn, cur, query, params):
+    if cur is not None:
+        cur.close()
+    cur = conn.cursor(name="stream")
+    cur.execute(query, params)
+    return cur
+
+class Snapshot:
+    """Queries on one connection in a read-only REPEATABLE READ transaction,
+    so they all see the same committed state. close() gives the
+    connection back.
+    """
+
+    def __init__(self, db, conn):
+        self.db = db
+        self.conn = conn
+        self.cur = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.db.executor, fn, *args)
+
+    async def fetch_one(self, query, params=None):
+        return await self._run(_fetch, self.conn, query, params, False)
+
+    async def batches(self, query, params, encode, batch_size=STREAM_BATCH_SIZE):
+        """``encode(rows, first)`` for every ``batch_size`` rows of ``query``,
+        read like Database.stream from a server-side cursor, which stays
+        open until the next query or close()."""
+        self.cur = await self._run(_open_cursor, self.conn, self.cur, query, params)
+        first = True
+        while True:
+            chunk = await self._run(_next_chunk, self.cur, batch_size, encode, first)
+            if chunk is None:
+                break
+            first = False
+            yield chunk
+
+    def close(self):
+        self.db.give_back(_close_stream, self.db.pool, self.conn, self.cur)
+
+class Database:
+    """Data layer of the endpoints.
+
+    psycopg2 blocks, so every query runs in a dedicated thread pool on a
+    connection borrowed for just that query. The event loop keeps serving
+    other requests meanwhile, and up to ``workers`` queries overlap.
+
+    A connection slot is claimed on the event loop before any work is
+    handed to the executor and freed once the connection is back in the
+    pool. Worker threads therefore never wait for the pool, and streams
+    holding a connection between chunks always find a thread for the next.
+    """
+
+    def __init__(self, pool, workers):
+        self.pool = pool
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        self.slots = asyncio.Semaphore(pool.maxconn)
+
+    async def claim(self):
+        """Wait up to the pool timeout for a connection slot."""
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.pool.timeout)
+        except asyncio.TimeoutError:
+            self.pool.record_wait(time.monotonic() - start, timed_out=True)
+            raise PoolTimeout(f"No database connection free after {self.pool.timeout}s") from None
+        self.pool.record_wait(time.monotonic() - start)
+
+    def give_back(self, fn, *args):
+        """Run ``fn(*args)``, which returns a connection to the pool, in the
+        executor and free its slot afterwards. Does not wait, so it can be
+        called from the finally of an async generator."""
+        loop = asyncio.get_running_loop()
+        self.executor.submit(fn, *args).add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self.slots.release))
+
+    async def connect(self):
+        """A connection of the pool, for callers that use it themselves;
+        hand it back with ``give_back(pool.putconn, conn)``."""
+        await self.claim()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.pool.getconn)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def _call(self, fn, args):
+        conn = self.pool.getconn()
+        try:
+            return fn(conn, *args)
+        finally:
+            self.pool.putconn(conn)
+
+    async def run(self, fn, *args):
+        """Await ``fn(connection, *args)`` run in the executor."""
+        await self.claim()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self._call, fn, args)
+        finally:
+            self.slots.release()
+
+    async def fetch_all(self, query, params=None):
+        return await self.run(_fetch, query, params, True)
+
+    async def fetch_one(self, query, params=None):
+        return await self.run(_fetch, query, params, False)
+
+    async def stream(self, query, params, encode, batch_size=STREAM_BATCH_SIZE):
+        """Run ``query`` on a server-side cursor and return an async iterator
+        of ``encode(rows, first)`` for every ``batch_size`` rows.
+
+        The query is started here, so errors still become a status code;
+        the connection is held until the iterator finishes or is closed.
+        Only one batch is in memory at a time.
+        """
+        loop = asyncio.get_running_loop()
+        conn = await self.connect()
+        cur = conn.cursor(name="stream")
+        try:
+            await loop.run_in_executor(self.executor, cur.execute, query, params)
+        except BaseException:
+            self.give_back(_close_stream, self.pool, conn, cur)
+            raise
+        return self._chunks(conn, cur, encode, batch_size)
+
+    async def _chunks(self, conn, cur, encode, batch_size):
+        loop = asyncio.get_running_loop()
+        try:
+            first = True
+            while True:
+                chunk = await loop.run_in_executor(self.executor, _next_chunk, cur, batch_size, encode, first)
+                if chunk is None:
+                    break
+                first = False
+                yield chunk
+        finally:
+            self.give_back(_close_stream, self.pool, conn, cur)
+
+    async def snapshot(self):
+        await self.claim()
+        try:
+            conn = await asyncio.get_running_loop().run_in_executor(self.executor, _begin_snapshot, self.pool)
+        except BaseException:
+            self.slots.release()
+            raise
+        return Snapshot(self, conn)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+# Tables that do not change after a load, and the routes serving them
+REFERENCE_TABLES = ('log', 'sensor', 'visibility', 'attribute', 'category', 'calibrated_sensor', 'map')
+CACHED_ROUTES = ('/logs', '/sensors', '/visibility', '/attributes', '/categories', '/calibrated_sensors', '/maps')
+# dbconnect.py notifies this channel with the dataset version after a load
+RELOAD_CHANNEL = 'nuscenes_reload'
+
+class ResponseCache:
+    """LRU of serialized reference table responses, kept per dataset version.
+
+    Entries also expire after ``ttl`` seconds. The version's ETag is
+    cached the same way and dropped with its entries when the version is
+    reloaded.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._etags = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def etag(self, version):
+        with self._lock:
+            expires, etag = self._etags.get(version, (0, None))
+            return etag if expires > time.monotonic() else None
+
+    def set_etag(self, version, etag):
+        with self._lock:
+            self._etags[version] = (time.monotonic() + self.ttl, etag)
+
+    def get(self, version, key):
+        with self._lock:
+            entry = self._entries.get((version, key))
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end((version, key))
+            self.hits += 1
+            return entry[1:]
+
+    def put(self, version, key, body, headers):
+        with self._lock:
+            self._entries[(version, key)] = (time.monotonic() + self.ttl, body, headers)
+            self._entries.move_to_end((version, key))
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self, version=None):
+        with self._lock:
+            if version is None:
+                self._entries.clear()
+                self._etags.clear()
+            else:
+                for entry in [entry for entry in self._entries if entry[0] == version]:
+                    del self._entries[entry]
+                self._etags.pop(version, None)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "size": self.size, "hits": self.hits,
+                    "misses": self.misses, "not_modified": self.not_modified}
+
+class ReloadListener(threading.Thread):
+    """LISTENs on RELOAD_CHANNEL and clears the cache of reloaded versions.
+
+    A lost connection is retried; the whole cache is cleared on every
+    (re)connect, since a load may have finished while nobody listened.
+    """
+
+    def __init__(self, cache):
+        super().__init__(name="reload-listener", daemon=True)
+        self.cache = cache
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(host=DB_HOST, port=DB_PORT, database=DB_NAME, user=DB_USER,
+                                        password=DB_PASSWORD)
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute(f"LISTEN {RELOAD_CHANNEL}")
+                self.cache.clear()
+                while not self.stopped.is_set():
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            version = conn.notifies.pop(0).payload
+                            logger.info("Dataset %s reloaded, clearing cached responses", version or "(all)")
+                            self.cache.clear(version or None)
+            except (psycopg2.Error, OSError) as e:
+                logger.warning("Reload listener failed, retrying: %s", e)
+                self.stopped.wait(5)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join(timeout=5)
+
+pool = None
+database = None
+response_cache = None
+
+@asynccontextmanager
+async def lifespan(app):
+    global pool, database, response_cache
+    pool = ConnectionPool(DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_PING_AFTER,
+                          host=DB_HOST, port=DB_PORT, database=DB_NAME, user=DB_USER,
+                          password=DB_PASSWORD, cursor_factory=RealDictCursor)
+    database = Database(pool, DB_WORKERS)
+    response_cache = ResponseCache(CACHE_SIZE, CACHE_TTL)
+    listener = ReloadListener(response_cache)
+    if CACHE_SIZE:
+        listener.start()
+    try:
+        yield
+    finally:
+        if listener.is_alive():
+            listener.stop()
+        database.close()
+        pool.closeall()
+        pool = database = response_cache = None
+
+app = FastAPI(title="nuScenes API", lifespan=lifespan)
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -25,22 +601,256 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
-# Database connection
+# Reference table responses are served from ResponseCache with an ETag
+# that hashes the version's load_manifest rows; a matching If-None-Match
+# gets a 304 without touching the database
+async def reference_etag(version):
+    etag = response_cache.etag(version)
+    if etag is None:
+        row = await database.fetch_one("""
+            SELECT md5(string_agg(table_name || ':' || source_hash || ':' || loaded_at, ',' ORDER BY table_name)) AS tag
+            FROM load_manifest WHERE dataset_version = %s AND table_name = ANY(%s)
+        """, (version, list(REFERENCE_TABLES)))
+        if row["tag"] is None:
+            return None
+        etag = f'"{row["tag"]}"'
+        response_cache.set_etag(version, etag)
+    return etag
+
+@app.middleware("http")
+async def cache_reference_tables(request, call_next):
+    path = request.url.path
+    if (request.method != "GET" or response_cache is None or not response_cache.size
+            or not any(path == route or path.startswith(route + "/") for route in CACHED_ROUTES)):
+        return await call_next(request)
+    version = request.query_params.get("version", DEFAULT_VERSION)
+    try:
+        etag = await reference_etag(version)
+    except PoolTimeout:
+        etag = None
+    if etag is None:
+        return await call_next(request)
+    # Each representation of the same rows gets its own validator
+    etag = f'{etag[:-1]}-{negotiate_format(request, request.query_params.get("format"))}"'
+
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        response_cache.not_modified += 1
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"})
+
+    key = (path, tuple(sorted(request.query_params.multi_items())), request.headers.get("accept", ""))
+    cached = response_cache.get(version, key)
+    if cached is None:
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        headers = {name: response.headers[name] for name in ("content-type", "x-next-cursor")
+                   if name in response.headers}
+        response_cache.put(version, key, body, headers)
+    else:
+        body, headers = cached
+    return Response(content=body, headers={**headers, "ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept"})
+
+# Keyset pagination: a page is the first ``limit`` rows ordered by the
+# primary key after the key the cursor carries, which the primary key
+# index answers without counting or skipping rows. The cursor is opaque
+# to clients; it is only handed back in X-Next-Cursor.
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps({"after": key}).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor, pattern):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))["after"]
+        if not isinstance(key, str) or not re.match(pattern, key):
+            raise ValueError(key)
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return key
+
+# Encoders of streamed batches; arrays are written as JSON in CSV cells
+def ndjson_chunk(rows, first):
+    return "".join(json.dumps(row, default=str) + "\n" for row in rows)
+
+def csv_chunk(rows, first):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if first:
+        writer.writerow(rows[0].keys())
+    writer.writerows([json.dumps(value) if isinstance(value, list) else value for value in row.values()]
+                     for row in rows)
+    return buffer.getvalue()
+
+STREAM_ENCODERS = {"ndjson": ndjson_chunk, "csv": csv_chunk}
+
+# Encoders of whole pages. Rows come straight from the database with the
+# columns of the endpoint's model, so they are serialized as they are,
+# without validating every row against the response model
+def json_body(rows, columns):
+    return orjson.dumps(rows)
+
+def msgpack_body(rows, columns):
+    return msgpack.packb({column: [row[column] for row in rows] for column in columns}, default=str)
+
+def arrow_body(rows, columns):
+    table = pyarrow.table({column: [row[column] for row in rows] for column in columns})
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+PAGE_ENCODERS = {"json": json_body, "msgpack": msgpack_body, "arrow": arrow_body}
+PAGE_PACKAGES = {"msgpack": "msgpack", "arrow": "pyarrow"}
+
+def rows_response(rows, columns, format="json", headers=None):
+    return Response(content=PAGE_ENCODERS[format](rows, columns), media_type=PAGE_TYPES[format], headers=headers)
+
+# Column list of a model, for queries whose rows skip model validation
+def columns_of(model):
+    return list(model.model_fields)
+
+# Format of a list response: ?format= if given, else the known media type
+# of Accept with the highest q (the first listed on a tie; q=0 refuses a
+# type, wildcards stand for json), else json. The body depends on Accept,
+# hence the Vary header on every list response.
+MEDIA_FORMATS = {**{media_type: name for name, media_type in {**STREAM_TYPES, **PAGE_TYPES}.items()},
+                 "*/*": "json", "application/*": "json"}
+
+def negotiate_format(request, format=None):
+    if format is not None:
+        return format
+    best, best_q = "json", 0.0
+    for item in request.headers.get("accept", "").split(","):
+        media_type, *parameters = [part.strip() for part in item.split(";")]
+        q = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        format = MEDIA_FORMATS.get(media_type.lower())
+        if format is not None and q > best_q:
+            best, best_q = format, q
+    return best
+
+class Page:
+    """Paging and format parameters of the list endpoints."""
+
+    def __init__(self, request: Request, response: Response, limit: Limit = None, cursor: Cursor = None,
+                 format: Format = None):
+        format = negotiate_format(request, format)
+        if format in PAGE_PACKAGES and {"msgpack": msgpack, "arrow": pyarrow}[format] is None:
+            raise HTTPException(status_code=406, detail=f"{format} responses need the {PAGE_PACKAGES[format]} package")
+        self.response = response
+        self.format = format
+        self.stream = format in STREAM_TYPES
+        self.limit = DEFAULT_PAGE_SIZE if limit is None and not self.stream else limit
+        self.cursor = cursor
+
+async def fetch_page(db, page, model, table, key, clause, params, pattern=TOKEN_PATTERN):
+    """One page of ``table`` rows matching ``clause``, ordered by ``key``.
+
+    Only the columns of ``model`` are selected, and the page is encoded in
+    the requested format directly. One row more than the limit is fetched
+    to know whether another page follows; if so its cursor is set in the
+    X-Next-Cursor header. Streamed formats send every row after the cursor
+    (up to an explicit limit), encoded chunk by chunk as they are read from
+    a server-side cursor.
+    """
+    columns = columns_of(model)
+    params = list(params)
+    if page.cursor is not None:
+        clause += f" AND {key} > %s"
+        params.append(decode_cursor(page.cursor, pattern))
+    query = f"SELECT {', '.join(columns)} FROM {table} WHERE {clause} ORDER BY {key}"
+    if page.stream:
+        if page.limit is not None:
+            query += " LIMIT %s"
+            params.append(page.limit)
+        chunks = await db.stream(query, params, STREAM_ENCODERS[page.format])
+        return StreamingResponse(chunks, media_type=STREAM_TYPES[page.format], headers={"Vary": "Accept"})
+
+    rows = await db.fetch_all(f"{query} LIMIT %s", [*params, page.limit + 1])
+    headers = {"Vary": "Accept"}
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1][key])
+    return rows_response(rows, columns, page.format, headers)
+
+async def fetch_batch(db, model, table, key, version, tokens, uuid=True):
+    """Rows of ``table`` whose ``key`` is one of ``tokens``, in one query.
+
+    Rows come back in the order of their first request, and tokens without
+    a row are listed under ``missing`` instead of failing the request.
+    """
+    columns = columns_of(model)
+    if uuid:
+        tokens = [token.lower() for token in tokens]
+    tokens = list(dict.fromkeys(tokens))
+    rows = await db.fetch_all(f"""
+        SELECT {', '.join(columns)} FROM {table}
+        WHERE dataset_version = %s AND {key} = ANY(%s{'::uuid[]' if uuid else ''})
+    """, (version, tokens))
+    found = {row[key]: row for row in rows}
+    return Response(content=orjson.dumps({"rows": [found[token] for token in tokens if token in found],
+                                          "missing": [token for token in tokens if token not in found]}),
+                    media_type="application/json")
+
+async def walk_chain(db, model, table, start, params, limit=None, timestamp_from=None, timestamp_to=None,
+                     timestamp="t.timestamp", join=""):
+    """The prev/next linked records of ``table`` from the one ``start``
+    selects, in chain order, from a single recursive query.
+
+    Each step is a primary key lookup of the previous record's ``next``.
+    The walk stops after ``limit`` records or past ``timestamp_to``;
+    records before ``timestamp_from`` are skipped. ``join`` and
+    ``timestamp`` supply the time of tables without their own. Returns
+    None if ``start`` selects nothing.
+    """
+    columns = columns_of(model)
+    params = {**params, "limit": limit, "timestamp_from": timestamp_from, "timestamp_to": timestamp_to,
+              "max_length": limit if limit and timestamp_from is None else MAX_CHAIN_LENGTH}
+    rows = await db.fetch_all(f"""
+        WITH RECURSIVE chain AS (
+            SELECT t.*, {timestamp} AS chain_timestamp, 1 AS position FROM {table} t {join}
+            WHERE t.dataset_version = %(version)s AND t.token = ({start})
+          UNION ALL
+            SELECT t.*, {timestamp}, c.position + 1
+            FROM chain c JOIN {table} t ON t.dataset_version = c.dataset_version AND t.token = c.next {join}
+            WHERE c.position < %(max_length)s AND (%(timestamp_to)s::bigint IS NULL OR c.chain_timestamp <= %(timestamp_to)s)
+        )
+        SELECT {', '.join('chain_timestamp AS timestamp' if column == 'timestamp' else column for column in columns)}
+        FROM chain
+        WHERE (%(timestamp_from)s::bigint IS NULL OR chain_timestamp >= %(timestamp_from)s)
+          AND (%(timestamp_to)s::bigint IS NULL OR chain_timestamp <= %(timestamp_to)s)
+        ORDER BY position LIMIT %(limit)s
+    """, params)
+    if not rows and (await db.fetch_one(f"SELECT ({start}) AS token", params))["token"] is None:
+        return None
+    return rows_response(rows, columns)
+
+# Database access
 def get_db():
-    conn = psycopg2.connect(
-        host=DB_HOST,
-        port=DB_PORT,
-        database=DB_NAME,
-        user=DB_USER,
-        password=DB_PASSWORD,
-        cursor_factory=RealDictCursor
-    )
+    return database
+
+# A connection held for the whole request, for the sync diagnostics
+# endpoints that FastAPI runs in its own threadpool. It is claimed like
+# every other connection, so the query threads never wait for it.
+async def get_connection():
+    conn = await database.connect()
     try:
         yield conn
     finally:
-        conn.close()
+        database.give_back(pool.putconn, conn)
+
+# Dataset version selector; every query filters on it so that only the
+# matching partition of the large tables is scanned
+def get_version(version: str = Query(DEFAULT_VERSION, description="Dataset version, e.g. v1.0-mini")):
+    return version
 
 # Pydantic models
 class Log(BaseModel):
@@ -94,18 +904,20 @@ class Sample(BaseModel):
     next: Optional[str]
     prev: Optional[str]
 
+# Geometry columns are float8 arrays: translation [x, y, z], rotation
+# quaternion [w, x, y, z], size [width, length, height]
 class EgoPose(BaseModel):
     token: str
-    translation: Dict
-    rotation: Dict
+    translation: List[float]
+    rotation: List[float]
     timestamp: int
 
 class CalibratedSensor(BaseModel):
     token: str
     sensor_token: str
-    translation: Dict
-    rotation: Dict
-    camera_intrinsic: Optional[Dict]
+    translation: List[float]
+    rotation: List[float]
+    camera_intrinsic: Optional[List[List[float]]]
 
 class SampleData(BaseModel):
     token: str
@@ -126,14 +938,24 @@ class SampleAnnotation(BaseModel):
     sample_token: str
     instance_token: str
     visibility_token: str
-    translation: Dict
-    size: Dict
-    rotation: Dict
+    translation: List[float]
+    size: List[float]
+    rotation: List[float]
     num_lidar_pts: int
     num_radar_pts: int
     next: Optional[str]
     prev: Optional[str]
 
+# Spatial query results, with the distance to the query point in meters
+class SampleAnnotationDistance(SampleAnnotation):
+    distance: float
+
+class EgoPoseDistance(EgoPose):
+    distance: float
+
+class TrackAnnotation(SampleAnnotation):
+    timestamp: int
+
 class Lidarseg(BaseModel):
     token: str
     filename: str
@@ -145,296 +967,631 @@ class Map(BaseModel):
     category: str
     filename: str
 
+# Precomputed by scene_summary.py; stale rows wait for their next refresh
+class SceneSummary(BaseModel):
+    scene_token: str
+    name: Optional[str]
+    sample_count: int
+    annotation_count: int
+    lidar_pts: int
+    radar_pts: int
+    first_timestamp: Optional[int]
+    last_timestamp: Optional[int]
+    stale: bool
+
+class CategorySummary(BaseModel):
+    category_token: str
+    name: Optional[str]
+    annotation_count: int
+    lidar_pts: int
+    radar_pts: int
+
+# Body and response of the batch lookups
+T = TypeVar("T")
+
+class TokenBatch(BaseModel):
+    tokens: List[Annotated[str, Field(pattern=TOKEN_PATTERN)]] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+class VisibilityBatch(BaseModel):
+    tokens: List[Annotated[str, Field(pattern=VISIBILITY_PATTERN)]] = Field(min_length=1, max_length=MAX_BATCH_SIZE)
+
+class Batch(BaseModel, Generic[T]):
+    rows: List[T]
+    missing: List[str]
+
 # API Endpoints
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to nuScenes API"}
 
+@app.get("/versions", response_model=List[str])
+async def get_versions(db: Database = Depends(get_db)):
+    rows = await db.fetch_all("SELECT DISTINCT dataset_version FROM load_manifest ORDER BY dataset_version")
+    return [row['dataset_version'] for row in rows]
+
 # Log endpoints
 @app.get("/logs", response_model=List[Log])
-async def get_logs(db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM log")
-    logs = cur.fetchall()
-    cur.close()
-    return logs
+async def get_logs(page: Page = Depends(),
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    clause, params = where(version)
+    return await fetch_page(db, page, Log, "log", "token", clause, params)
+
+@app.post("/logs/batch", response_model=Batch[Log])
+async def get_logs_batch(batch: TokenBatch, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await fetch_batch(db, Log, "log", "token", version, batch.tokens)
 
 @app.get("/logs/{token}", response_model=Log)
-async def get_log(token: str, db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM log WHERE token = %s", (token,))
-    log = cur.fetchone()
-    cur.close()
+async def get_log(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    log = await db.fetch_one("SELECT * FROM log WHERE dataset_version = %s AND token = %s", (version, token))
     if not log:
         raise HTTPException(status_code=404, detail="Log not found")
     return log
 
 # Sensor endpoints
 @app.get("/sensors", response_model=List[Sensor])
-async def get_sensors(db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM sensor")
-    sensors = cur.fetchall()
-    cur.close()
-    return sensors
+async def get_sensors(channel: Channel = None, modality: Modality = None,
+        page: Page = Depends(),
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    clause, params = where(version, ("channel = %s", channel), ("modality = %s", modality))
+    return await fetch_page(db, page, Sensor, "sensor", "token", clause, params)
+
+@app.post("/sensors/batch", response_model=Batch[Sensor])
+async def get_sensors_batch(batch: TokenBatch, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await fetch_batch(db, Sensor, "sensor", "token", version, batch.tokens)
 
 @app.get("/sensors/{token}", response_model=Sensor)
-async def get_sensor(token: str, db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM sensor WHERE token = %s", (token,))
-    sensor = cur.fetchone()
-    cur.close()
+async def get_sensor(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    sensor = await db.fetch_one("SELECT * FROM sensor WHERE dataset_version = %s AND token = %s", (version, token))
     if not sensor:
         raise HTTPException(status_code=404, detail="Sensor not found")
     return sensor
 
 # Visibility endpoints
 @app.get("/visibility", response_model=List[Visibility])
-async def get_visibility_all(db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM visibility")
-    visibility = cur.fetchall()
-    cur.close()
-    return visibility
+async def get_visibility_all(page: Page = Depends(),
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    clause, params = where(version)
+    return await fetch_page(db, page, Visibility, "visibility", "token", clause, params, pattern=VISIBILITY_PATTERN)
+
+@app.post("/visibility/batch", response_model=Batch[Visibility])
+async def get_visibility_batch(batch: VisibilityBatch, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await fetch_batch(db, Visibility, "visibility", "token", version, batch.tokens, uuid=False)
 
 @app.get("/visibility/{token}", response_model=Visibility)
-async def get_visibility(token: str, db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM visibility WHERE token = %s", (token,))
-    visibility = cur.fetchone()
-    cur.close()
+async def get_visibility(token: str, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    visibility = await db.fetch_one("SELECT * FROM visibility WHERE dataset_version = %s AND token = %s", (version, token))
     if not visibility:
         raise HTTPException(status_code=404, detail="Visibility not found")
     return visibility
 
 # Attribute endpoints
 @app.get("/attributes", response_model=List[Attribute])
-async def get_attributes(db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM attribute")
-    attributes = cur.fetchall()
-    cur.close()
-    return attributes
+async def get_attributes(page: Page = Depends(),
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    clause, params = where(version)
+    return await fetch_page(db, page, Attribute, "attribute", "token", clause, params)
+
+@app.post("/attributes/batch", response_model=Batch[Attribute])
+async def get_attributes_batch(batch: TokenBatch, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await fetch_batch(db, Attribute, "attribute", "token", version, batch.tokens)
 
 @app.get("/attributes/{token}", response_model=Attribute)
-async def get_attribute(token: str, db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM attribute WHERE token = %s", (token,))
-    attribute = cur.fetchone()
-    cur.close()
+async def get_attribute(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    attribute = await db.fetch_one("SELECT * FROM attribute WHERE dataset_version = %s AND token = %s", (version, token))
     if not attribute:
         raise HTTPException(status_code=404, detail="Attribute not found")
     return attribute
 
 # Category endpoints
 @app.get("/categories", response_model=List[Category])
-async def get_categories(db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM category")
-    categories = cur.fetchall()
-    cur.close()
-    return categories
+async def get_categories(category: CategoryName = None,
+        page: Page = Depends(),
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    clause, params = where(version, ("starts_with(name || '.', %s || '.')", category))
+    return await fetch_page(db, page, Category, "category", "token", clause, params)
+
+@app.post("/categories/batch", response_model=Batch[Category])
+async def get_categories_batch(batch: TokenBatch, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await fetch_batch(db, Category, "category", "token", version, batch.tokens)
 
 @app.get("/categories/{token}", response_model=Category)
-async def get_category(token: str, db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM category WHERE token = %s", (token,))
-    category = cur.fetchone()
-    cur.close()
+async def get_category(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    category = await db.fetch_one("SELECT * FROM category WHERE dataset_version = %s AND token = %s", (version, token))
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     return category
 
 # Instance endpoints
 @app.get("/instances", response_model=List[Instance])
-async def get_instances(db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM instance")
-    instances = cur.fetchall()
-    cur.close()
-    return instances
+async def get_instances(category_token: TokenFilter = None, category: CategoryName = None,
+        page: Page = Depends(),
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    clause, params = where(version, ("category_token = %s", category_token),
+                           (f"EXISTS ({INSTANCE_CATEGORY} AND {CATEGORY_MATCH})", category))
+    return await fetch_page(db, page, Instance, "instance", "token", clause, params)
+
+@app.post("/instances/batch", response_model=Batch[Instance])
+async def get_instances_batch(batch: TokenBatch, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await fetch_batch(db, Instance, "instance", "token", version, batch.tokens)
 
 @app.get("/instances/{token}", response_model=Instance)
-async def get_instance(token: str, db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM instance WHERE token = %s", (token,))
-    instance = cur.fetchone()
-    cur.close()
+async def get_instance(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    instance = await db.fetch_one("SELECT * FROM instance WHERE dataset_version = %s AND token = %s", (version, token))
     if not instance:
         raise HTTPException(status_code=404, detail="Instance not found")
     return instance
 
+@app.get("/instances/{token}/track", response_model=List[TrackAnnotation])
+async def get_instance_track(token: Token, limit: ChainLimit = None,
+        timestamp_from: TimestampFrom = None, timestamp_to: TimestampTo = None,
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    """Annotations of the instance in next-order, with their sample's timestamp."""
+    track = await walk_chain(db, TrackAnnotation, "sample_annotation", """
+        SELECT first_annotation_token FROM instance WHERE dataset_version = %(version)s AND token = %(token)s
+    """, {"version": version, "token": token}, limit, timestamp_from, timestamp_to,
+        timestamp="s.timestamp", join="JOIN sample s ON s.dataset_version = t.dataset_version AND s.token = t.sample_token")
+    if track is None:
+        raise HTTPException(status_code=404, detail="Instance not found")
+    return track
+
 # Scene endpoints
 @app.get("/scenes", response_model=List[Scene])
-async def get_scenes(db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM scenes")
-    scenes = cur.fetchall()
-    cur.close()
-    return scenes
+async def get_scenes(log_token: TokenFilter = None, location: Location = None,
+        page: Page = Depends(),
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    clause, params = where(version, ("log_token = %s", log_token),
+                           (f"EXISTS ({SCENE_LOG} AND l.location = %s)", location))
+    return await fetch_page(db, page, Scene, "scenes", "scene_token", clause, params)
+
+@app.post("/scenes/batch", response_model=Batch[Scene])
+async def get_scenes_batch(batch: TokenBatch, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await fetch_batch(db, Scene, "scenes", "scene_token", version, batch.tokens)
 
 @app.get("/scenes/{token}", response_model=Scene)
-async def get_scene(token: str, db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM scenes WHERE scene_token = %s", (token,))
-    scene = cur.fetchone()
-    cur.close()
+async def get_scene(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    scene = await db.fetch_one("SELECT * FROM scenes WHERE dataset_version = %s AND scene_token = %s", (version, token))
     if not scene:
         raise HTTPException(status_code=404, detail="Scene not found")
     return scene
 
+# The record graph of one scene, one set-based query per section. Every
+# query reads its table as ``t``; rows of the sample_data and annotation
+# sections are reached through the scene's samples, the referenced
+# records through the tokens those rows carry
+SCENE_SAMPLES = "SELECT token FROM sample WHERE dataset_version = %(version)s AND scene_token = %(token)s"
+SCENE_SAMPLE_DATA = f"SELECT {{}} FROM sample_data WHERE dataset_version = %(version)s AND sample_token IN ({SCENE_SAMPLES})"
+SCENE_ANNOTATIONS = f"SELECT {{}} FROM sample_annotation WHERE dataset_version = %(version)s AND sample_token IN ({SCENE_SAMPLES})"
+BUNDLE_SECTIONS = [
+    ("scene", Scene, "scenes t WHERE t.dataset_version = %(version)s AND t.scene_token = %(token)s", "t.scene_token"),
+    ("samples", Sample, "sample t WHERE t.dataset_version = %(version)s AND t.scene_token = %(token)s", "t.timestamp"),
+    ("sample_data", SampleData,
+     f"sample_data t WHERE t.dataset_version = %(version)s AND t.sample_token IN ({SCENE_SAMPLES})", "t.timestamp"),
+    ("sample_annotations", SampleAnnotation,
+     f"sample_annotation t WHERE t.dataset_version = %(version)s AND t.sample_token IN ({SCENE_SAMPLES})", "t.token"),
+    ("ego_poses", EgoPose,
+     f"ego_pose t WHERE t.dataset_version = %(version)s AND t.token IN ({SCENE_SAMPLE_DATA.format('ego_pose_token')})",
+     "t.timestamp"),
+    ("calibrated_sensors", CalibratedSensor,
+     f"calibrated_sensor t WHERE t.dataset_version = %(version)s "
+     f"AND t.token IN ({SCENE_SAMPLE_DATA.format('calibrated_sensor_token')})", "t.token"),
+    ("instances", Instance,
+     f"instance t WHERE t.dataset_version = %(version)s AND t.token IN ({SCENE_ANNOTATIONS.format('instance_token')})",
+     "t.token"),
+    ("categories", Category,
+     f"category t WHERE t.dataset_version = %(version)s AND t.token IN (SELECT category_token FROM instance "
+     f"WHERE dataset_version = %(version)s AND token IN ({SCENE_ANNOTATIONS.format('instance_token')}))", "t.token"),
+]
+
+# Validator of a bundle: the load of each source table (load_manifest)
+# and the edits counted since by the triggers of migration 006, for the
+# scene and for the tables that scenes share. It reads a few key lookups,
+# none of the bundle's rows.
+BUNDLE_TABLES = [source.split()[0] for name, model, source, order in BUNDLE_SECTIONS]
+BUNDLE_VALIDATOR = """
+    SELECT EXISTS (SELECT 1 FROM scenes WHERE dataset_version = %(version)s AND scene_token = %(token)s) AS found,
+           (SELECT string_agg(table_name || ':' || source_hash || ':' || loaded_at, ',' ORDER BY table_name)
+            FROM load_manifest WHERE dataset_version = %(version)s AND table_name = ANY(%(tables)s)) AS loaded,
+           (SELECT string_agg(table_name || ':' || changes, ',' ORDER BY table_name)
+            FROM table_changes WHERE dataset_version = %(version)s AND table_name = ANY(%(tables)s)) AS shared,
+           (SELECT changes FROM scene_changes
+            WHERE dataset_version = %(version)s AND scene_token = %(token)s) AS changes
+"""
+
+def json_rows_chunk(rows, first):
+    return (b"" if first else b",") + b",".join(orjson.dumps(row) for row in rows)
+
+async def bundle_chunks(snapshot, params):
+    """The bundle as one JSON object, each section sent in batches as they
+    are read from the snapshot the validator was read in."""
+    try:
+        for i, (name, model, source, order) in enumerate(BUNDLE_SECTIONS):
+            single = name == "scene"
+            yield (b"{" if i == 0 else b",") + orjson.dumps(name) + (b":" if single else b":[")
+            async for chunk in snapshot.batches(f"SELECT {', '.join(f't.{column}' for column in columns_of(model))} "
+                                                f"FROM {source} ORDER BY {order}", params, json_rows_chunk):
+                yield chunk
+            if not single:
+                yield b"]"
+        yield b"}"
+    finally:
+        snapshot.close()
+
+@app.get("/scenes/{token}/bundle")
+async def get_scene_bundle(token: Token, request: Request, db: Database = Depends(get_db),
+                           version: str = Depends(get_version)):
+    """Scene with its samples, sample_data, annotations, ego poses,
+    calibrated sensors, instances and categories."""
+    params = {"version": version, "token": token.lower(), "tables": BUNDLE_TABLES}
+    snapshot = await db.snapshot()
+    try:
+        state = await snapshot.fetch_one(BUNDLE_VALIDATOR, params)
+    except Exception:
+        snapshot.close()
+        raise
+    if not state["found"]:
+        snapshot.close()
+        raise HTTPException(status_code=404, detail="Scene not found")
+    validator = f"{version}/{token.lower()}/{state['loaded']}/{state['shared']}/{state['changes']}"
+    etag = '"' + hashlib.md5(validator.encode()).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        snapshot.close()
+        return Response(status_code=304, headers=headers)
+    return StreamingResponse(bundle_chunks(snapshot, params), media_type="application/json", headers=headers)
+
+@app.get("/scenes/{token}/samples", response_model=List[Sample])
+async def get_scene_samples(token: Token, limit: ChainLimit = None,
+        timestamp_from: TimestampFrom = None, timestamp_to: TimestampTo = None,
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    """Samples of the scene in next-order, from its first sample."""
+    samples = await walk_chain(db, Sample, "sample", """
+        SELECT first_sample_token FROM scenes WHERE dataset_version = %(version)s AND scene_token = %(token)s
+    """, {"version": version, "token": token}, limit, timestamp_from, timestamp_to)
+    if samples is None:
+        raise HTTPException(status_code=404, detail="Scene not found")
+    return samples
+
 # Sample endpoints
 @app.get("/samples", response_model=List[Sample])
-async def get_samples(db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM sample")
-    samples = cur.fetchall()
-    cur.close()
-    return samples
+async def get_samples(scene_token: TokenFilter = None,
+        timestamp_from: TimestampFrom = None, timestamp_to: TimestampTo = None,
+        page: Page = Depends(),
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    clause, params = where(version, ("scene_token = %s", scene_token),
+                           ("timestamp >= %s", timestamp_from), ("timestamp <= %s", timestamp_to))
+    return await fetch_page(db, page, Sample, "sample", "token", clause, params)
+
+@app.post("/samples/batch", response_model=Batch[Sample])
+async def get_samples_batch(batch: TokenBatch, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await fetch_batch(db, Sample, "sample", "token", version, batch.tokens)
 
 @app.get("/samples/{token}", response_model=Sample)
-async def get_sample(token: str, db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM sample WHERE token = %s", (token,))
-    sample = cur.fetchone()
-    cur.close()
+async def get_sample(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    sample = await db.fetch_one("SELECT * FROM sample WHERE dataset_version = %s AND token = %s", (version, token))
     if not sample:
         raise HTTPException(status_code=404, detail="Sample not found")
     return sample
 
 # EgoPose endpoints
 @app.get("/ego_poses", response_model=List[EgoPose])
-async def get_ego_poses(db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM ego_pose")
-    ego_poses = cur.fetchall()
-    cur.close()
-    return ego_poses
+async def get_ego_poses(timestamp_from: TimestampFrom = None, timestamp_to: TimestampTo = None,
+        page: Page = Depends(),
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    clause, params = where(version, ("timestamp >= %s", timestamp_from), ("timestamp <= %s", timestamp_to))
+    return await fetch_page(db, page, EgoPose, "ego_pose", "token", clause, params)
+
+@app.post("/ego_poses/batch", response_model=Batch[EgoPose])
+async def get_ego_poses_batch(batch: TokenBatch, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await fetch_batch(db, EgoPose, "ego_pose", "token", version, batch.tokens)
 
 @app.get("/ego_poses/{token}", response_model=EgoPose)
-async def get_ego_pose(token: str, db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM ego_pose WHERE token = %s", (token,))
-    ego_pose = cur.fetchone()
-    cur.close()
+async def get_ego_pose(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    ego_pose = await db.fetch_one("SELECT * FROM ego_pose WHERE dataset_version = %s AND token = %s", (version, token))
     if not ego_pose:
         raise HTTPException(status_code=404, detail="EgoPose not found")
     return ego_pose
 
 # CalibratedSensor endpoints
 @app.get("/calibrated_sensors", response_model=List[CalibratedSensor])
-async def get_calibrated_sensors(db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM calibrated_sensor")
-    sensors = cur.fetchall()
-    cur.close()
-    return sensors
+async def get_calibrated_sensors(sensor_token: TokenFilter = None, channel: Channel = None, modality: Modality = None,
+        page: Page = Depends(),
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    clause, params = where(version, ("sensor_token = %s", sensor_token),
+                           exists(CALIBRATED_SENSOR_SENSOR, ("se.channel = %s", channel), ("se.modality = %s", modality)))
+    return await fetch_page(db, page, CalibratedSensor, "calibrated_sensor", "token", clause, params)
+
+@app.post("/calibrated_sensors/batch", response_model=Batch[CalibratedSensor])
+async def get_calibrated_sensors_batch(batch: TokenBatch, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await fetch_batch(db, CalibratedSensor, "calibrated_sensor", "token", version, batch.tokens)
 
 @app.get("/calibrated_sensors/{token}", response_model=CalibratedSensor)
-async def get_calibrated_sensor(token: str, db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM calibrated_sensor WHERE token = %s", (token,))
-    sensor = cur.fetchone()
-    cur.close()
+async def get_calibrated_sensor(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    sensor = await db.fetch_one("SELECT * FROM calibrated_sensor WHERE dataset_version = %s AND token = %s", (version, token))
     if not sensor:
         raise HTTPException(status_code=404, detail="CalibratedSensor not found")
     return sensor
 
 # SampleData endpoints
 @app.get("/sample_data", response_model=List[SampleData])
-async def get_sample_data_all(db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM sample_data")
-    data = cur.fetchall()
-    cur.close()
-    return data
+async def get_sample_data_all(sample_token: TokenFilter = None, calibrated_sensor_token: TokenFilter = None,
+        ego_pose_token: TokenFilter = None, timestamp_from: TimestampFrom = None, timestamp_to: TimestampTo = None,
+        channel: Channel = None, modality: Modality = None, is_key_frame: KeyFrame = None,
+        page: Page = Depends(),
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    clause, params = where(version, ("sample_token = %s", sample_token),
+                           ("calibrated_sensor_token = %s", calibrated_sensor_token),
+                           ("ego_pose_token = %s", ego_pose_token), ("timestamp >= %s", timestamp_from),
+                           ("timestamp <= %s", timestamp_to), ("is_key_frame = %s", is_key_frame),
+                           exists(SAMPLE_DATA_SENSOR, ("se.channel = %s", channel), ("se.modality = %s", modality)))
+    return await fetch_page(db, page, SampleData, "sample_data", "token", clause, params)
+
+@app.post("/sample_data/batch", response_model=Batch[SampleData])
+async def get_sample_data_batch(batch: TokenBatch, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await fetch_batch(db, SampleData, "sample_data", "token", version, batch.tokens)
 
 @app.get("/sample_data/{token}", response_model=SampleData)
-async def get_sample_data(token: str, db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM sample_data WHERE token = %s", (token,))
-    data = cur.fetchone()
-    cur.close()
+async def get_sample_data(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    data = await db.fetch_one("SELECT * FROM sample_data WHERE dataset_version = %s AND token = %s", (version, token))
     if not data:
         raise HTTPException(status_code=404, detail="SampleData not found")
     return data
 
+# The sample_data of ``channel`` closest in time to the given one within
+# its sample, preferring keyframes
+CHANNEL_SAMPLE_DATA = """
+    SELECT sd.token FROM sample_data a
+    JOIN sample_data sd ON sd.dataset_version = a.dataset_version AND sd.sample_token = a.sample_token
+    JOIN calibrated_sensor cs ON cs.dataset_version = sd.dataset_version AND cs.token = sd.calibrated_sensor_token
+    JOIN sensor se ON se.dataset_version = cs.dataset_version AND se.token = cs.sensor_token
+    WHERE a.dataset_version = %(version)s AND a.token = %(token)s AND se.channel = %(channel)s
+    ORDER BY sd.is_key_frame DESC, abs(sd.timestamp - a.timestamp) LIMIT 1
+"""
+
+@app.get("/sample_data/{token}/sweep", response_model=List[SampleData])
+async def get_sample_data_sweep(token: Token,
+        channel: Optional[str] = Query(None, description="Sensor channel, e.g. LIDAR_TOP (default: this one's)"),
+        limit: ChainLimit = None, timestamp_from: TimestampFrom = None, timestamp_to: TimestampTo = None,
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    """Every sample_data of the sensor's prev/next chain through this one
+    (or through the closest one of ``channel``), from the first sweep on."""
+    anchor = CHANNEL_SAMPLE_DATA if channel else "SELECT %(token)s::uuid"
+    sweep = await walk_chain(db, SampleData, "sample_data", f"""
+        WITH RECURSIVE back AS (
+            SELECT token, prev, 0 AS steps FROM sample_data WHERE dataset_version = %(version)s AND token = ({anchor})
+          UNION ALL
+            SELECT t.token, t.prev, b.steps + 1 FROM back b
+            JOIN sample_data t ON t.dataset_version = %(version)s AND t.token = b.prev
+            WHERE b.steps < {MAX_CHAIN_LENGTH}
+        )
+        SELECT token FROM back ORDER BY steps DESC LIMIT 1
+    """, {"version": version, "token": token, "channel": channel}, limit, timestamp_from, timestamp_to)
+    if sweep is None:
+        if channel and await db.fetch_one("SELECT 1 FROM sample_data WHERE dataset_version = %s AND token = %s", (version, token)):
+            raise HTTPException(status_code=404, detail=f"No {channel} sample_data in this sample")
+        raise HTTPException(status_code=404, detail="SampleData not found")
+    return sweep
+
 # SampleAnnotation endpoints
 @app.get("/sample_annotations", response_model=List[SampleAnnotation])
-async def get_sample_annotations(db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM sample_annotation")
-    annotations = cur.fetchall()
-    cur.close()
-    return annotations
+async def get_sample_annotations(sample_token: TokenFilter = None, instance_token: TokenFilter = None,
+        category: CategoryName = None, visibility: VisibilityLevel = None,
+        min_num_lidar_pts: MinPoints = None, min_num_radar_pts: MinPoints = None,
+        timestamp_from: TimestampFrom = None, timestamp_to: TimestampTo = None,
+        page: Page = Depends(),
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    clause, params = where(version, ("sample_token = %s", sample_token),
+                           ("instance_token = %s", instance_token),
+                           (f"EXISTS ({ANNOTATION_CATEGORY} AND {CATEGORY_MATCH})", category),
+                           (ANNOTATION_VISIBILITY, None if visibility is None else (version, visibility)),
+                           ("num_lidar_pts >= %s", min_num_lidar_pts), ("num_radar_pts >= %s", min_num_radar_pts),
+                           exists(ANNOTATION_SAMPLE, ("s.timestamp >= %s", timestamp_from),
+                                  ("s.timestamp <= %s", timestamp_to)))
+    return await fetch_page(db, page, SampleAnnotation, "sample_annotation", "token", clause, params)
+
+@app.post("/sample_annotations/batch", response_model=Batch[SampleAnnotation])
+async def get_sample_annotations_batch(batch: TokenBatch, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await fetch_batch(db, SampleAnnotation, "sample_annotation", "token", version, batch.tokens)
 
 @app.get("/sample_annotations/{token}", response_model=SampleAnnotation)
-async def get_sample_annotation(token: str, db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM sample_annotation WHERE token = %s", (token,))
-    annotation = cur.fetchone()
-    cur.close()
+async def get_sample_annotation(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    annotation = await db.fetch_one("SELECT * FROM sample_annotation WHERE dataset_version = %s AND token = %s", (version, token))
     if not annotation:
         raise HTTPException(status_code=404, detail="SampleAnnotation not found")
     return annotation
 
 # Lidarseg endpoints
 @app.get("/lidarsegs", response_model=List[Lidarseg])
-async def get_lidarsegs(db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM lidarseg")
-    lidarsegs = cur.fetchall()
-    cur.close()
-    return lidarsegs
+async def get_lidarsegs(sample_data_token: TokenFilter = None,
+        page: Page = Depends(),
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    clause, params = where(version, ("sample_data_token = %s", sample_data_token))
+    return await fetch_page(db, page, Lidarseg, "lidarseg", "token", clause, params)
+
+@app.post("/lidarsegs/batch", response_model=Batch[Lidarseg])
+async def get_lidarsegs_batch(batch: TokenBatch, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await fetch_batch(db, Lidarseg, "lidarseg", "token", version, batch.tokens)
 
 @app.get("/lidarsegs/{token}", response_model=Lidarseg)
-async def get_lidarseg(token: str, db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM lidarseg WHERE token = %s", (token,))
-    lidarseg = cur.fetchone()
-    cur.close()
+async def get_lidarseg(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    lidarseg = await db.fetch_one("SELECT * FROM lidarseg WHERE dataset_version = %s AND token = %s", (version, token))
     if not lidarseg:
         raise HTTPException(status_code=404, detail="Lidarseg not found")
     return lidarseg
 
 # Map endpoints
 @app.get("/maps", response_model=List[Map])
-async def get_maps(db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM map")
-    maps = cur.fetchall()
-    cur.close()
-    return maps
+async def get_maps(page: Page = Depends(),
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    clause, params = where(version)
+    return await fetch_page(db, page, Map, "map", "token", clause, params)
+
+@app.post("/maps/batch", response_model=Batch[Map])
+async def get_maps_batch(batch: TokenBatch, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await fetch_batch(db, Map, "map", "token", version, batch.tokens)
 
 @app.get("/maps/{token}", response_model=Map)
-async def get_map(token: str, db: psycopg2.extensions.connection = Depends(get_db)):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM map WHERE token = %s", (token,))
-    map_data = cur.fetchone()
-    cur.close()
+async def get_map(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    map_data = await db.fetch_one("SELECT * FROM map WHERE dataset_version = %s AND token = %s", (version, token))
     if not map_data:
         raise HTTPException(status_code=404, detail="Map not found")
     return map_data
 
+# Summary endpoints (served from the scene summary tables, no joins over the data)
+SCENE_SUMMARY_QUERY = """
+    SELECT t.scene_token, sc.name, t.sample_count, t.annotation_count, t.lidar_pts, t.radar_pts,
+           t.first_timestamp, t.last_timestamp,
+           EXISTS (SELECT 1 FROM scene_summary_stale q
+                   WHERE q.dataset_version = t.dataset_version AND q.scene_token = t.scene_token) AS stale
+    FROM scene_summary t
+    LEFT JOIN scenes sc ON sc.dataset_version = t.dataset_version AND sc.scene_token = t.scene_token
+"""
+
+@app.get("/scene_summaries", response_model=List[SceneSummary])
+async def get_scene_summaries(db: Database = Depends(get_db), version: str = Depends(get_version)):
+    summaries = await db.fetch_all(f"{SCENE_SUMMARY_QUERY} WHERE t.dataset_version = %s ORDER BY t.first_timestamp", (version,))
+    return summaries
+
+@app.get("/scene_summaries/{token}", response_model=SceneSummary)
+async def get_scene_summary(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    summary = await db.fetch_one(f"{SCENE_SUMMARY_QUERY} WHERE t.dataset_version = %s AND t.scene_token = %s", (version, token))
+    if not summary:
+        raise HTTPException(status_code=404, detail="Scene summary not found")
+    return summary
+
+@app.get("/scene_summaries/{token}/categories", response_model=List[CategorySummary])
+async def get_scene_category_summaries(token: Token, db: Database = Depends(get_db), version: str = Depends(get_version)):
+    summaries = await db.fetch_all("""
+        SELECT t.category_token, c.name, t.annotation_count, t.lidar_pts, t.radar_pts
+        FROM scene_category_summary t
+        LEFT JOIN category c ON c.dataset_version = t.dataset_version AND c.token = t.category_token
+        WHERE t.dataset_version = %s AND t.scene_token = %s
+        ORDER BY t.annotation_count DESC
+    """, (version, token))
+    return summaries
+
+@app.get("/category_summaries", response_model=List[CategorySummary])
+async def get_category_summaries(db: Database = Depends(get_db), version: str = Depends(get_version)):
+    summaries = await db.fetch_all("""
+        SELECT t.category_token, c.name, sum(t.annotation_count) AS annotation_count,
+               sum(t.lidar_pts) AS lidar_pts, sum(t.radar_pts) AS radar_pts
+        FROM scene_category_summary t
+        LEFT JOIN category c ON c.dataset_version = t.dataset_version AND c.token = t.category_token
+        WHERE t.dataset_version = %s
+        GROUP BY t.category_token, c.name
+        ORDER BY annotation_count DESC
+    """, (version,))
+    return summaries
+
+# Spatial endpoints (GiST index on the x/y position)
+# Rows are returned with the columns of ``model`` plus their distance,
+# serialized without per-row validation like the list pages. A row is in
+# the location of its scene's log, reached through its sample (ego poses
+# through the sample_data recorded at them).
+LOG_OF_SAMPLE = """JOIN scenes sc ON sc.dataset_version = s.dataset_version AND sc.scene_token = s.scene_token
+    JOIN log l ON l.dataset_version = sc.dataset_version AND l.token = sc.log_token"""
+IN_LOCATION = {
+    "sample_annotation": f"""EXISTS (SELECT 1 FROM sample s {LOG_OF_SAMPLE}
+        WHERE s.dataset_version = sample_annotation.dataset_version AND s.token = sample_annotation.sample_token
+          AND l.location = %s)""",
+    "ego_pose": f"""EXISTS (SELECT 1 FROM sample_data sd
+        JOIN sample s ON s.dataset_version = sd.dataset_version AND s.token = sd.sample_token {LOG_OF_SAMPLE}
+        WHERE sd.dataset_version = ego_pose.dataset_version AND sd.ego_pose_token = ego_pose.token
+          AND l.location = %s)""",
+}
+
+async def within_radius(db, model, table, version, location, x, y, radius, limit):
+    columns = columns_of(model)
+    rows = await db.fetch_all(f"""
+        SELECT {', '.join(columns)}, {POSITION} <-> point(%s, %s) AS distance FROM {table}
+        WHERE dataset_version = %s AND {POSITION} <@ circle(point(%s, %s), %s) AND {IN_LOCATION[table]}
+        ORDER BY {POSITION} <-> point(%s, %s) LIMIT %s
+    """, (x, y, version, x, y, radius, location, x, y, limit))
+    return rows_response(rows, columns + ["distance"])
+
+async def nearest(db, model, table, version, location, x, y, k):
+    columns = columns_of(model)
+    rows = await db.fetch_all(f"""
+        SELECT {', '.join(columns)}, {POSITION} <-> point(%s, %s) AS distance FROM {table}
+        WHERE dataset_version = %s AND {IN_LOCATION[table]}
+        ORDER BY {POSITION} <-> point(%s, %s) LIMIT %s
+    """, (x, y, version, location, x, y, k))
+    return rows_response(rows, columns + ["distance"])
+
+async def within_box(db, model, table, version, location, min_x, min_y, max_x, max_y, limit):
+    columns = columns_of(model)
+    rows = await db.fetch_all(f"""
+        SELECT {', '.join(columns)} FROM {table}
+        WHERE dataset_version = %s AND {POSITION} <@ box(point(%s, %s), point(%s, %s)) AND {IN_LOCATION[table]}
+        ORDER BY token LIMIT %s
+    """, (version, min_x, min_y, max_x, max_y, location, limit))
+    return rows_response(rows, columns)
+
+@app.get("/spatial/sample_annotations/radius", response_model=List[SampleAnnotationDistance])
+async def get_sample_annotations_in_radius(location: MapLocation, x: X, y: Y, radius: Radius,
+        limit: SpatialLimit = DEFAULT_PAGE_SIZE,
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await within_radius(db, SampleAnnotation, "sample_annotation", version, location, x, y, radius, limit)
+
+@app.get("/spatial/sample_annotations/nearest", response_model=List[SampleAnnotationDistance])
+async def get_nearest_sample_annotations(location: MapLocation, x: X, y: Y, k: Nearest = 10,
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await nearest(db, SampleAnnotation, "sample_annotation", version, location, x, y, k)
+
+@app.get("/spatial/sample_annotations/box", response_model=List[SampleAnnotation])
+async def get_sample_annotations_in_box(location: MapLocation, min_x: X, min_y: Y, max_x: X, max_y: Y,
+        limit: SpatialLimit = DEFAULT_PAGE_SIZE,
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await within_box(db, SampleAnnotation, "sample_annotation", version, location,
+                            min_x, min_y, max_x, max_y, limit)
+
+@app.get("/spatial/ego_poses/radius", response_model=List[EgoPoseDistance])
+async def get_ego_poses_in_radius(location: MapLocation, x: X, y: Y, radius: Radius,
+        limit: SpatialLimit = DEFAULT_PAGE_SIZE,
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await within_radius(db, EgoPose, "ego_pose", version, location, x, y, radius, limit)
+
+@app.get("/spatial/ego_poses/nearest", response_model=List[EgoPoseDistance])
+async def get_nearest_ego_poses(location: MapLocation, x: X, y: Y, k: Nearest = 10,
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await nearest(db, EgoPose, "ego_pose", version, location, x, y, k)
+
+@app.get("/spatial/ego_poses/box", response_model=List[EgoPose])
+async def get_ego_poses_in_box(location: MapLocation, min_x: X, min_y: Y, max_x: X, max_y: Y,
+        limit: SpatialLimit = DEFAULT_PAGE_SIZE,
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    return await within_box(db, EgoPose, "ego_pose", version, location, min_x, min_y, max_x, max_y, limit)
+
+@app.get("/ego_poses/{token}/sample_annotations", response_model=List[SampleAnnotationDistance])
+async def get_sample_annotations_near_ego_pose(token: Token, radius: Radius,
+        limit: SpatialLimit = DEFAULT_PAGE_SIZE,
+        db: Database = Depends(get_db), version: str = Depends(get_version)):
+    """Annotations within ``radius`` of the ego pose, in the map of its own log."""
+    ego_pose = await db.fetch_one(f"""
+        SELECT e.translation, (SELECT l.location FROM sample_data sd
+            JOIN sample s ON s.dataset_version = sd.dataset_version AND s.token = sd.sample_token {LOG_OF_SAMPLE}
+            WHERE sd.dataset_version = e.dataset_version AND sd.ego_pose_token = e.token LIMIT 1) AS location
+        FROM ego_pose e WHERE e.dataset_version = %s AND e.token = %s
+    """, (version, token))
+    if not ego_pose:
+        raise HTTPException(status_code=404, detail="EgoPose not found")
+    if ego_pose['location'] is None:
+        raise HTTPException(status_code=404, detail="No log records this EgoPose")
+    x, y = ego_pose['translation'][:2]
+    return await within_radius(db, SampleAnnotation, "sample_annotation", version, ego_pose['location'],
+                               x, y, radius, limit)
+
 # Health check endpoint
 @app.get("/health")
-def health_check():
+async def health_check():
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD
-        )
-        conn.close()
-        return {"status": "healthy", "database": "connected"}
+        await database.fetch_one("SELECT 1")
+        return {"status": "healthy", "database": "connected", "pool": pool.stats(), "cache": response_cache.stats()}
     except Exception as e:
-        return {"status": "unhealthy", "database": str(e)}
+        return {"status": "unhealthy", "database": str(e), "pool": pool.stats(), "cache": response_cache.stats()}
 
 @app.get("/test_endpoints")
-async def test_endpoints(db: psycopg2.extensions.connection = Depends(get_db)):
+def test_endpoints(db: psycopg2.extensions.connection = Depends(get_connection)):
     endpoints = {
         "logs": "/logs",
         "sensors": "/sensors",
@@ -518,7 +1675,7 @@ async def test_endpoints(db: psycopg2.extensions.connection = Depends(get_db)):
 
 # Add a more detailed health check
 @app.get("/detailed_health")
-async def detailed_health_check(db: psycopg2.extensions.connection = Depends(get_db)):
+def detailed_health_check(db: psycopg2.extensions.connection = Depends(get_connection)):
     try:
         cur = db.cursor()
         
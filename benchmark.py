@@ -0,0 +1,467 @@
+"""Loader benchmark: generates a synthetic nuScenes-shaped dataset, loads it
+into the database configured by the DB_* variables with each loader
+strategy and writes the measurements to a JSON file.
+
+The loader tables are dropped and recreated, so point DB_NAME at a
+scratch database.
+
+    python benchmark.py --scale mini
+    python benchmark.py --scale trainval --strategies parallel,fast
+    python benchmark.py --scale 50 --baseline bench_results/<previous>.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import dbconnect
+import migrations
+from load_metrics import configure_logging
+from nuscenes_reader import iter_table
+
+VERSION = 'v1.0-bench'
+
+# Number of scenes in the real releases
+SCALES = {'mini': 10, 'trainval': 850}
+
+# Loader settings compared by the benchmark
+STRATEGIES = {
+    'serial': {'load_workers': 1, 'fast_load': False},
+    'parallel': {'load_workers': 4, 'fast_load': False},
+    'fast': {'load_workers': 4, 'fast_load': True},
+}
+
+# Sensor channels with the number of sample_data records per sample,
+# roughly matching the sweep rates of the real rig
+CHANNELS = [
+    ('CAM_FRONT', 'camera', 6), ('CAM_FRONT_RIGHT', 'camera', 6), ('CAM_FRONT_LEFT', 'camera', 6),
+    ('CAM_BACK', 'camera', 6), ('CAM_BACK_LEFT', 'camera', 6), ('CAM_BACK_RIGHT', 'camera', 6),
+    ('LIDAR_TOP', 'lidar', 10),
+    ('RADAR_FRONT', 'radar', 7), ('RADAR_FRONT_LEFT', 'radar', 7), ('RADAR_FRONT_RIGHT', 'radar', 7),
+    ('RADAR_BACK_LEFT', 'radar', 7), ('RADAR_BACK_RIGHT', 'radar', 7),
+]
+
+
+def new_token():
+    return uuid.uuid4().hex
+
+
+class JsonArrayWriter:
+    """Writes one JSON table record by record so generation memory stays flat."""
+
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.file.write('[\n')
+        self.count = 0
+
+    def write(self, record):
+        if self.count:
+            self.file.write(',\n')
+        json.dump(record, self.file)
+        self.count += 1
+
+    def close(self):
+        self.file.write('\n]\n')
+        self.file.close()
+
+
+def link(records):
+    """Fill prev/next of an ordered list of records."""
+    for i, record in enumerate(records):
+        record['prev'] = records[i - 1]['token'] if i else ''
+        record['next'] = records[i + 1]['token'] if i + 1 < len(records) else ''
+
+
+def generate_dataset(dataroot, scenes, samples_per_scene=40, instances_per_scene=35, seed=0):
+    """Write a synthetic ``<dataroot>/v1.0-bench`` with ``scenes`` scenes.
+
+    Records have the fields and linking of the real JSON tables (linked
+    samples, annotation tracks per instance, sweeps per channel with one
+    ego pose each), so the loader does the same work per row as on
+    nuScenes. Returns ``table -> record count``.
+    """
+    rng = random.Random(seed)
+    directory = os.path.join(dataroot, VERSION)
+    os.makedirs(directory, exist_ok=True)
+    names = ['visibility', 'log', 'sensor', 'category', 'attribute', 'instance', 'scene', 'sample',
+             'sample_annotation', 'ego_pose', 'calibrated_sensor', 'sample_data', 'map']
+    writers = {name: JsonArrayWriter(os.path.join(directory, f'{name}.json')) for name in names}
+
+    visibility = [{'token': str(level), 'level': f'v{(level - 1) * 20}-{level * 20 + (20 if level == 4 else 0)}',
+                   'description': 'visibility of whole object is between 0 and 40%'} for level in range(1, 5)]
+    categories = [{'token': new_token(), 'name': name, 'description': f'{name} description', 'index': i}
+                  for i, name in enumerate(['human.pedestrian.adult', 'vehicle.car', 'vehicle.truck',
+                                            'vehicle.bicycle', 'movable_object.barrier'])]
+    sensors = [{'token': new_token(), 'channel': channel, 'modality': modality}
+               for channel, modality, _ in CHANNELS]
+    calibrated = [{'token': new_token(), 'sensor_token': sensor['token'],
+                   'translation': [1.7, 0.0, 1.5], 'rotation': [0.5, -0.5, 0.5, -0.5],
+                   'camera_intrinsic': [[1266.4, 0.0, 816.3], [0.0, 1266.4, 491.5], [0.0, 0.0, 1.0]]
+                   if sensor['modality'] == 'camera' else []} for sensor in sensors]
+    channels = list(zip(CHANNELS, calibrated))
+    logs = [{'token': new_token(), 'logfile': f'n015-2018-07-24-11-22-45+0800-{i}', 'vehicle': 'n015',
+             'date_captured': '2018-07-24', 'location': 'singapore-onenorth'}
+            for i in range(max(1, scenes // 10))]
+
+    for record in visibility:
+        writers['visibility'].write(record)
+    for record in categories:
+        writers['category'].write(record)
+    for record in sensors:
+        writers['sensor'].write(record)
+    for record in calibrated:
+        writers['calibrated_sensor'].write(record)
+    for record in logs:
+        writers['log'].write(record)
+    writers['attribute'].write({'token': new_token(), 'name': 'vehicle.moving', 'description': 'Vehicle is moving.'})
+    writers['map'].write({'token': new_token(), 'log_tokens': [log['token'] for log in logs],
+                          'category': 'semantic_prior', 'filename': 'maps/map.png'})
+
+    timestamp = 1532402927647951
+    for index in range(scenes):
+        scene = {'token': new_token(), 'name': f'scene-{index:04d}', 'description': 'Synthetic scene, parked cars',
+                 'log_token': logs[index % len(logs)]['token'], 'nbr_samples': samples_per_scene}
+        samples = []
+        for _ in range(samples_per_scene):
+            timestamp += 500000
+            samples.append({'token': new_token(), 'timestamp': timestamp, 'scene_token': scene['token']})
+        link(samples)
+        scene['first_sample_token'] = samples[0]['token']
+        scene['last_sample_token'] = samples[-1]['token']
+        writers['scene'].write(scene)
+        for sample in samples:
+            writers['sample'].write(sample)
+
+        for _ in range(instances_per_scene):
+            start = rng.randrange(samples_per_scene)
+            track = samples[start:start + rng.randint(1, samples_per_scene)]
+            x, y = rng.uniform(300, 1500), rng.uniform(300, 1500)
+            annotations = [{'token': new_token(), 'sample_token': sample['token'], 'instance_token': None,
+                            'visibility_token': rng.choice(visibility)['token'], 'attribute_tokens': [],
+                            'translation': [x + i * 0.5, y + i * 0.1, 1.0], 'size': [1.9, 4.6, 1.7],
+                            'rotation': [0.98, 0.0, 0.0, 0.19], 'num_lidar_pts': rng.randint(0, 500),
+                            'num_radar_pts': rng.randint(0, 10)} for i, sample in enumerate(track)]
+            link(annotations)
+            instance = {'token': new_token(), 'category_token': rng.choice(categories)['token'],
+                        'nbr_annotations': len(annotations),
+                        'first_annotation_token': annotations[0]['token'],
+                        'last_annotation_token': annotations[-1]['token']}
+            writers['instance'].write(instance)
+            for annotation in annotations:
+                annotation['instance_token'] = instance['token']
+                writers['sample_annotation'].write(annotation)
+
+        for (channel, modality, per_sample), sensor in channels:
+            sweeps = []
+            for sample in samples:
+                for sweep in range(per_sample):
+                    pose = {'token': new_token(), 'timestamp': sample['timestamp'] + sweep * 500000 // per_sample,
+                            'translation': [rng.uniform(300, 1500), rng.uniform(300, 1500), 0.0],
+                            'rotation': [0.57, -0.0, 0.01, -0.82]}
+                    writers['ego_pose'].write(pose)
+                    extension = 'jpg' if modality == 'camera' else 'pcd.bin' if modality == 'lidar' else 'pcd'
+                    sweeps.append({'token': new_token(), 'sample_token': sample['token'],
+                                   'ego_pose_token': pose['token'], 'calibrated_sensor_token': sensor['token'],
+                                   'timestamp': pose['timestamp'], 'fileformat': extension.split('.')[0],
+                                   'is_key_frame': sweep == 0,
+                                   'height': 900 if modality == 'camera' else 0,
+                                   'width': 1600 if modality == 'camera' else 0,
+                                   'filename': f"{'samples' if sweep == 0 else 'sweeps'}/{channel}/"
+                                               f"{pose['timestamp']}.{extension}"})
+            link(sweeps)
+            for record in sweeps:
+                writers['sample_data'].write(record)
+
+    counts = {}
+    for name, writer in writers.items():
+        writer.close()
+        counts[name] = writer.count
+    return counts
+
+
+def current_rss():
+    """Resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # ru_maxrss is the peak so far (kilobytes on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class PeakRSS:
+    """Tracks the peak resident set size while the block runs."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def wal_lsn(cursor):
+    cursor.execute("SELECT pg_current_wal_insert_lsn()")
+    return cursor.fetchone()[0]
+
+
+def wal_bytes(cursor, start_lsn):
+    cursor.execute("SELECT pg_wal_lsn_diff(pg_current_wal_insert_lsn(), %s)", (start_lsn,))
+    return int(cursor.fetchone()[0])
+
+
+def prepare_schema(connection):
+    dbconnect.reset_schema(connection)
+    with open(dbconnect.sql_file_path) as file:
+        sql_commands = file.read()
+    cursor = connection.cursor()
+    cursor.execute(sql_commands)
+    connection.commit()
+    cursor.close()
+    migrations.migrate(connection)
+
+
+def profile_tables(connection):
+    """Load every table serially, recording rows/s, peak RSS and WAL per table."""
+    prepare_schema(connection)
+    tables, hashes = dbconnect.plan_load(connection, VERSION)
+    dbconnect.attach_version(connection, VERSION)
+    cursor = connection.cursor()
+    results = {}
+    for spec in tables:
+        start_lsn = wal_lsn(cursor)
+        connection.commit()
+        with PeakRSS() as rss:
+            records = iter_table(dbconnect.dataroot, VERSION, spec.source)
+            rows, seconds = dbconnect.load_table(connection, spec, VERSION, records, hashes[spec.table])
+        results[spec.table] = {
+            'rows': rows,
+            'seconds': round(seconds, 4),
+            'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+            'peak_rss_bytes': rss.peak,
+            'wal_bytes': wal_bytes(cursor, start_lsn),
+        }
+        connection.commit()
+    cursor.close()
+    return results
+
+
+def run_strategy(connection, settings):
+    """Run a full load with the given dbconnect settings and measure it."""
+    prepare_schema(connection)
+    for name, value in settings.items():
+        setattr(dbconnect, name, value)
+    cursor = connection.cursor()
+    start_lsn = wal_lsn(cursor)
+    connection.commit()
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        dbconnect.load_version(connection, VERSION)
+        seconds = time.perf_counter() - start
+    cursor.execute("SELECT coalesce(sum(row_count), 0) FROM load_manifest WHERE dataset_version = %s", (VERSION,))
+    rows = int(cursor.fetchone()[0])
+    result = {
+        'settings': settings,
+        'rows': rows,
+        'seconds': round(seconds, 4),
+        'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+        'peak_rss_bytes': rss.peak,
+        'wal_bytes': wal_bytes(cursor, start_lsn),
+    }
+    connection.commit()
+    cursor.close()
+    return result
+
+
+# Token key representations compared by compare_keys(): the hex strings of
+# the original schema and the uuid columns
+KEY_TYPES = {
+    'varchar': "replace({column}::text, '-', '')::varchar(255)",
+    'uuid': "{column}",
+}
+
+
+def compare_keys(connection, repeat=3):
+    """Index size and join time of sample_data -> ego_pose with each key type.
+
+    Copies the loaded keys into temporary tables, indexes them like the
+    loader tables (primary key plus the foreign key column) and times the
+    join; the best of ``repeat`` runs is kept.
+    """
+    cursor = connection.cursor()
+    results = {}
+    for kind, expression in KEY_TYPES.items():
+        key = expression.format
+        data, pose = f'bench_sample_data_{kind}', f'bench_ego_pose_{kind}'
+        cursor.execute(f"""
+        CREATE TEMP TABLE {data} AS
+        SELECT {key(column='token')} AS token, {key(column='ego_pose_token')} AS ego_pose_token
+        FROM sample_data WHERE dataset_version = %s
+        """, (VERSION,))
+        cursor.execute(f"CREATE TEMP TABLE {pose} AS SELECT {key(column='token')} AS token "
+                       f"FROM ego_pose WHERE dataset_version = %s", (VERSION,))
+        cursor.execute(f"ALTER TABLE {data} ADD PRIMARY KEY (token)")
+        cursor.execute(f"ALTER TABLE {pose} ADD PRIMARY KEY (token)")
+        cursor.execute(f"CREATE INDEX ON {data} (ego_pose_token)")
+        cursor.execute(f"ANALYZE {data}")
+        cursor.execute(f"ANALYZE {pose}")
+        cursor.execute("SELECT sum(pg_relation_size(indexrelid)) FROM pg_index WHERE indrelid = ANY(%s::regclass[])",
+                       ([data, pose],))
+        index_bytes = int(cursor.fetchone()[0])
+
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cursor.execute(f"SELECT count(*) FROM {data} d JOIN {pose} p ON p.token = d.ego_pose_token")
+            cursor.fetchone()
+            timings.append(time.perf_counter() - start)
+        results[kind] = {'index_bytes': index_bytes, 'join_seconds': round(min(timings), 4)}
+        print(f"{kind:8} keys: indexes {index_bytes / 1e6:.1f} MB, join {min(timings):.3f}s")
+        cursor.execute(f"DROP TABLE {data}, {pose}")
+    connection.commit()
+    cursor.close()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(result, baseline, threshold, min_rows=1000):
+    """Print rows/s changes against ``baseline``; returns the regressions.
+
+    Tables under ``min_rows`` load in a few milliseconds and are too noisy
+    to compare.
+    """
+    regressions = []
+    sections = [('table', result['tables'], baseline.get('tables', {})),
+                ('strategy', result['strategies'], baseline.get('strategies', {}))]
+    for kind, current, previous in sections:
+        for name, metrics in current.items():
+            before = previous.get(name, {}).get('rows_per_sec')
+            after = metrics.get('rows_per_sec')
+            if not before or not after or metrics.get('rows', 0) < min_rows:
+                continue
+            change = (after - before) / before
+            marker = ''
+            if change < -threshold:
+                marker = '  REGRESSION'
+                regressions.append(f'{kind} {name}')
+            print(f"{kind:8} {name:20} {before:>12,.0f} -> {after:>12,.0f} rows/s ({change:+.1%}){marker}")
+    return regressions
+
+
+def latest_result(directory, exclude=None):
+    paths = [os.path.join(directory, name) for name in os.listdir(directory)
+             if name.endswith('.json') and os.path.join(directory, name) != exclude]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the nuScenes loader")
+    parser.add_argument('--scale', default='mini',
+                        help="mini (10 scenes), trainval (850 scenes) or a number of scenes")
+    parser.add_argument('--strategies', default=','.join(STRATEGIES),
+                        help=f"comma separated subset of {', '.join(STRATEGIES)}")
+    parser.add_argument('--dataroot', help="reuse a dataset generated earlier instead of a temporary one")
+    parser.add_argument('--output', default='bench_results', help="directory for the JSON results")
+    parser.add_argument('--baseline', help="result file to compare with (default: latest in --output)")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative rows/s drop reported as a regression (default 0.10)")
+    parser.add_argument('--min-rows', type=int, default=1000,
+                        help="ignore tables with fewer rows when comparing (default 1000)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    configure_logging()
+    scenes = SCALES.get(args.scale) or int(args.scale)
+    strategies = [name.strip() for name in args.strategies.split(',') if name.strip()]
+
+    dataroot = args.dataroot or tempfile.mkdtemp(prefix='nuscenes-bench-')
+    try:
+        if not os.path.exists(os.path.join(dataroot, VERSION, 'sample_data.json')):
+            start = time.perf_counter()
+            counts = generate_dataset(dataroot, scenes)
+            print(f"Generated {sum(counts.values())} records for {scenes} scenes "
+                  f"in {time.perf_counter() - start:.2f}s")
+
+        dbconnect.dataroot = dataroot
+        defaults = {name: getattr(dbconnect, name) for name in ('load_workers', 'fast_load')}
+        connection = dbconnect.get_db_connection()
+        try:
+            dbconnect.load_workers, dbconnect.fast_load = 1, False
+            tables = profile_tables(connection)
+            keys = compare_keys(connection)
+            results = {}
+            for name in strategies:
+                print(f"Running strategy {name}")
+                results[name] = run_strategy(connection, STRATEGIES[name])
+                for setting, value in defaults.items():
+                    setattr(dbconnect, setting, value)
+            # Wall-clock speedup of each strategy over the serial load of the same data
+            if 'serial' in results:
+                for name, measured in results.items():
+                    measured['speedup'] = round(results['serial']['seconds'] / measured['seconds'], 2)
+                    print(f"{name:8} {measured['seconds']:8.2f}s  {measured['speedup']:.2f}x serial")
+        finally:
+            connection.close()
+    finally:
+        if not args.dataroot:
+            shutil.rmtree(dataroot, ignore_errors=True)
+
+    result = {
+        'commit': git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'scale': args.scale,
+        'scenes': scenes,
+        'tables': tables,
+        'strategies': results,
+        'keys': keys,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{result['created_at'][:19].replace(':', '')}-{result['commit']}.json")
+    with open(path, 'w') as file:
+        json.dump(result, file, indent=2)
+    print(f"Results written to {path}")
+
+    baseline = args.baseline or latest_result(args.output, exclude=path)
+    if baseline:
+        with open(baseline) as file:
+            regressions = compare(result, json.load(file), args.threshold, args.min_rows)
+        if regressions:
+            print(f"Throughput regressions against {baseline}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,20 @@
 import psycopg2
 import os
+import io
+import time
+import hashlib
+import re
+import argparse
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from psycopg2.pool import ThreadedConnectionPool
 from dotenv import load_dotenv
-from nuscenes.nuscenes import NuScenes
+from nuscenes_reader import iter_table, table_path
+from load_metrics import TableProgress, configure_logging, event
+import load_validation
+import migrations
+import scene_summary
 import json
 
 load_dotenv()
@@ -13,9 +26,27 @@ user = os.getenv('DB_USER')
 password = os.getenv('DB_PASSWORD')
 
 sql_file_path = os.getenv('SQL_FILE_PATH', '/app/nuScene.sql')
+dataroot = os.getenv('NUSCENES_DATAROOT', '/mnt/c/Users/mrifk/Desktop/v1.0-mini')
+# Comma separated dataset versions to load, each into its own partitions
+versions = [v.strip() for v in os.getenv('NUSCENES_VERSIONS', 'v1.0-mini').split(',') if v.strip()]
+# Drop every table before loading instead of resuming from load_manifest
+reset = os.getenv('NUSCENES_RESET', '0') == '1'
+
+# Number of rows buffered in memory before each COPY round trip
+copy_batch_size = int(os.getenv('COPY_BATCH_SIZE', '50000'))
+# Number of tables loaded concurrently, each on its own connection
+load_workers = int(os.getenv('LOAD_WORKERS', '4'))
+# Load without foreign keys and secondary indexes, then rebuild them
+fast_load = os.getenv('NUSCENES_FAST_LOAD', '0') == '1'
+# max_parallel_maintenance_workers for the post-load index builds
+maintenance_workers = int(os.getenv('MAINTENANCE_WORKERS', '4'))
+# Channel notified with the dataset version after it was (re)loaded, so
+# that API processes drop their cached responses
+reload_channel = 'nuscenes_reload'
+# Loader sessions skip the scene summary triggers and refresh the
+# summaries of each loaded version in one pass instead
+session_options = '-c nuscenes.loading=on'
 
-connection = None
-cursor = None
 
 def get_db_connection():
     return psycopg2.connect(
@@ -23,326 +54,727 @@ def get_db_connection():
         database=os.getenv('DB_NAME'),
         user=os.getenv('DB_USER'),
         password=os.getenv('DB_PASSWORD'),
-        port=os.getenv('DB_PORT')
+        port=os.getenv('DB_PORT'),
+        options=session_options
     )
 
-try:
-    connection = psycopg2.connect(
-        host=host,
-        port=port,
-        database=database,
-        user=user,
-        password=password
-    )
-    cursor = connection.cursor()
 
-    with open(sql_file_path, 'r') as file:
-        sql_commands = file.read()
-    cursor.execute(sql_commands)
+# Tokens are stored as uuid; read them back in the 32 hex digit nuScenes form
+def uuid_as_hex(value, cursor):
+    return value.replace('-', '') if value is not None else None
+
+
+UUID_HEX = psycopg2.extensions.new_type((2950,), 'UUID_HEX', uuid_as_hex)
+psycopg2.extensions.register_type(UUID_HEX)
+psycopg2.extensions.register_type(psycopg2.extensions.new_array_type((2951,), 'UUID_HEX[]', UUID_HEX))
+
+
+def token_or_none(token):
+    # nuScenes uses an empty string for missing prev/next links
+    return token if token else None
+
+
+def pg_array(values):
+    """Render a list of strings as a PostgreSQL array literal."""
+    items = []
+    for value in values:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+        items.append(f'"{value}"')
+    return '{' + ','.join(items) + '}'
+
+
+def pg_float_array(values):
+    """Render a (nested) list of numbers as a PostgreSQL float8[] literal."""
+    return '{' + ','.join(pg_float_array(value) if isinstance(value, (list, tuple)) else repr(float(value))
+                          for value in values) + '}'
+
+
+def copy_field(value):
+    """Render a single value in COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+# A loadable table: target table, source JSON table, COPY columns, row
+# builder and the tables its foreign keys point at (see nuScene.sql)
+TableSpec = namedtuple('TableSpec', ['table', 'source', 'columns', 'row', 'depends_on'])
+
+# Tables in serial insert order
+TABLES = [
+    TableSpec('visibility', 'visibility',
+              ('token', 'level', 'description'),
+              lambda r: (r['token'], r['level'], r['description']),
+              ()),
+    TableSpec('log', 'log',
+              ('token', 'logfile', 'vehicle', 'date_captured', 'location'),
+              lambda r: (r['token'], r['logfile'], r['vehicle'], r['date_captured'], r['location']),
+              ()),
+    TableSpec('sensor', 'sensor',
+              ('token', 'channel', 'modality'),
+              lambda r: (r['token'], r['channel'], r['modality']),
+              ()),
+    TableSpec('category', 'category',
+              ('token', 'name', 'description', 'index'),
+              lambda r: (r['token'], r['name'], r['description'], r.get('index', None)),
+              ()),
+    TableSpec('instance', 'instance',
+              ('token', 'category_token', 'nbr_annotations', 'first_annotation_token', 'last_annotation_token'),
+              lambda r: (r['token'], r['category_token'], r['nbr_annotations'],
+                         r['first_annotation_token'], r['last_annotation_token']),
+              ('category',)),
+    TableSpec('scenes', 'scene',
+              ('scene_token', 'name', 'description', 'log_token', 'nbr_samples',
+               'first_sample_token', 'last_sample_token'),
+              lambda r: (r['token'], r['name'], r['description'], r['log_token'], r['nbr_samples'],
+                         r['first_sample_token'], r['last_sample_token']),
+              ('log',)),
+    TableSpec('sample', 'sample',
+              ('token', 'timestamp', 'scene_token', 'prev', 'next'),
+              lambda r: (r['token'], r['timestamp'], r['scene_token'],
+                         token_or_none(r['prev']), token_or_none(r['next'])),
+              ('scenes',)),
+    TableSpec('sample_annotation', 'sample_annotation',
+              ('token', 'sample_token', 'instance_token', 'visibility_token', 'translation', 'size', 'rotation',
+               'num_lidar_pts', 'num_radar_pts', 'prev', 'next'),
+              lambda r: (r['token'], r['sample_token'], r['instance_token'], r['visibility_token'],
+                         pg_float_array(r['translation']), pg_float_array(r['size']),
+                         pg_float_array(r['rotation']),
+                         r['num_lidar_pts'], r['num_radar_pts'],
+                         token_or_none(r['prev']), token_or_none(r['next'])),
+              ('sample', 'instance', 'visibility')),
+    TableSpec('attribute', 'attribute',
+              ('token', 'name', 'description'),
+              lambda r: (r['token'], r['name'], r['description']),
+              ()),
+    TableSpec('ego_pose', 'ego_pose',
+              ('token', 'translation', 'rotation', 'timestamp'),
+              lambda r: (r['token'], pg_float_array(r['translation']), pg_float_array(r['rotation']),
+                         r['timestamp']),
+              ()),
+    TableSpec('calibrated_sensor', 'calibrated_sensor',
+              ('token', 'sensor_token', 'translation', 'rotation', 'camera_intrinsic'),
+              lambda r: (r['token'], r['sensor_token'], pg_float_array(r['translation']),
+                         pg_float_array(r['rotation']),
+                         pg_float_array(r['camera_intrinsic']) if r['camera_intrinsic'] else None),
+              ('sensor',)),
+    TableSpec('sample_data', 'sample_data',
+              ('token', 'sample_token', 'ego_pose_token', 'calibrated_sensor_token', 'timestamp', 'fileformat',
+               'is_key_frame', 'height', 'width', 'filename', 'prev', 'next'),
+              lambda r: (r['token'], r['sample_token'], r['ego_pose_token'], r['calibrated_sensor_token'],
+                         r['timestamp'], r['fileformat'], r['is_key_frame'], r['height'], r['width'],
+                         r['filename'], token_or_none(r['prev']), token_or_none(r['next'])),
+              ('sample', 'ego_pose', 'calibrated_sensor')),
+    TableSpec('map', 'map',
+              ('token', 'log_tokens', 'category', 'filename'),
+              lambda r: (r['token'], pg_array(r['log_tokens']), r['category'], r['filename']),
+              ()),
+    TableSpec('lidarseg', 'lidarseg',
+              ('token', 'filename', 'sample_data_token'),
+              lambda r: (r['token'], r['filename'], r['sample_data_token']),
+              ('sample_data',)),
+]
+
+# Tables list-partitioned by dataset_version in nuScene.sql, parents first
+PARTITIONED_TABLES = ('ego_pose', 'sample_data', 'sample_annotation', 'lidarseg')
+
+
+def copy_rows(cursor, table, columns, rows, batch_size=None, progress=None):
+    """Stream rows into ``table`` with COPY FROM STDIN, one buffer per batch.
+
+    ``progress`` (a TableProgress) is advanced after each batch. Returns
+    the number of rows copied. The caller owns the transaction.
+    """
+    batch_size = batch_size or copy_batch_size
+    copy_sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    buffer = io.StringIO()
+    pending = 0
+    total = 0
+
+    for row in rows:
+        buffer.write('\t'.join(copy_field(value) for value in row))
+        buffer.write('\n')
+        pending += 1
+        if pending >= batch_size:
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+            total += pending
+            if progress is not None:
+                progress.advance(pending)
+            pending = 0
+            buffer = io.StringIO()
+
+    if pending:
+        buffer.seek(0)
+        cursor.copy_expert(copy_sql, buffer)
+        total += pending
+        if progress is not None:
+            progress.advance(pending)
+
+    return total
+
+
+def source_path(spec, version):
+    return table_path(dataroot, version, spec.source)
+
+
+def file_hash(path):
+    """SHA-256 of a source JSON file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def descendants(table, tables=TABLES):
+    """Tables that reference ``table`` directly or transitively."""
+    found = set()
+    frontier = [table]
+    while frontier:
+        parent = frontier.pop()
+        for spec in tables:
+            if parent in spec.depends_on and spec.table not in found:
+                found.add(spec.table)
+                frontier.append(spec.table)
+    return found
+
+
+def reset_schema(connection):
+    """Drop all loader tables so nuScene.sql recreates them empty."""
+    names = ', '.join(spec.table for spec in reversed(TABLES))
+    cursor = connection.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {names}, load_manifest, load_deferred_ddl, load_quarantine, "
+                   f"schema_migrations, scene_summary, scene_category_summary, scene_summary_stale, "
+                   f"scene_changes, table_changes CASCADE")
     connection.commit()
+    cursor.close()
 
-    dataroot = os.getenv('NUSCENES_DATAROOT', '/mnt/c/Users/mrifk/Desktop/v1.0-mini')
 
-    # Initialize NuScenes with the correct path
-    nusc = NuScenes(version='v1.0-mini', dataroot=dataroot, verbose=True)
+def partition_name(table, version):
+    """Partition holding ``version`` rows, e.g. sample_data_v1_0_mini."""
+    return f"{table}_{re.sub(r'[^0-9a-z]+', '_', version.lower())}"
 
-    print(f"Number of visibility records: {len(nusc.visibility)}")
-    insert_visibility_query = """
-    INSERT INTO visibility (token, level, description)
-    VALUES (%s, %s, %s)
-    """
-    for visibility in nusc.visibility:
-        cursor.execute(insert_visibility_query, (
-            visibility['token'],
-            visibility['level'],
-            visibility['description']
-        ))
-    connection.commit()
-    print("Visibility records inserted successfully.")
 
-    print(f"Number of log records: {len(nusc.log)}")
-    insert_log_query = """
-    INSERT INTO log (token, logfile, vehicle, date_captured, location)
-    VALUES (%s, %s, %s, %s, %s)
-    """
-    for log in nusc.log:
-        cursor.execute(insert_log_query, (
-            log['token'],
-            log['logfile'],
-            log['vehicle'],
-            log['date_captured'],
-            log['location']
-        ))
-
-    print(f"Number of sensor records: {len(nusc.sensor)}")
-    insert_sensor_query = """
-    INSERT INTO sensor (token, channel, modality)
-    VALUES (%s, %s, %s)
-    """
-    for sensor in nusc.sensor:
-        cursor.execute(insert_sensor_query, (
-            sensor['token'],
-            sensor['channel'],
-            sensor['modality']
-        ))
-
-    print(f"Number of category records: {len(nusc.category)}")
-    insert_category_query = """
-    INSERT INTO category (token, name, description, index)
-    VALUES (%s, %s, %s, %s)
-    """
-    for category in nusc.category:
-        cursor.execute(insert_category_query, (
-            category['token'],
-            category['name'],
-            category['description'],
-            category.get('index', None)
-        ))
-
-    print(f"Number of instance records: {len(nusc.instance)}")
-    insert_instance_query = """
-    INSERT INTO instance (token, category_token, nbr_annotations, first_annotation_token, last_annotation_token)
-    VALUES (%s, %s, %s, %s, %s)
-    """
-    for instance in nusc.instance:
-        cursor.execute(insert_instance_query, (
-            instance['token'],
-            instance['category_token'],
-            instance['nbr_annotations'],
-            instance['first_annotation_token'],
-            instance['last_annotation_token']
-        ))
-
-    print(f"Number of scenes records: {len(nusc.scene)}")
-    insert_scene_query = """
-    INSERT INTO scenes (scene_token, name, description, log_token, nbr_samples, first_sample_token, last_sample_token)
-    VALUES (%s, %s, %s, %s, %s, %s, %s)
+def partition_state(cursor, table, version):
+    """'attached', 'detached' or None when the partition does not exist."""
+    cursor.execute("""
+    SELECT c.relispartition FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = current_schema() AND c.relname = %s
+    """, (partition_name(table, version),))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return 'attached' if row[0] else 'detached'
+
+
+def attach_version(connection, version, skip=()):
+    """Create or re-attach the partitions of ``version``, except ``skip``.
+
+    Parents are attached before the partitions referencing them so that
+    the foreign keys PostgreSQL adds on ATTACH validate.
     """
-    for scene in nusc.scene:
-        cursor.execute(insert_scene_query, (
-            scene['token'],
-            scene['name'],
-            scene['description'],
-            scene['log_token'],
-            scene['nbr_samples'],
-            scene['first_sample_token'],
-            scene['last_sample_token']
-        ))
-
-    print(f"Number of sample records: {len(nusc.sample)}")
-    insert_sample_query = """
-    INSERT INTO sample (token, timestamp, scene_token)
-    VALUES (%s, %s, %s)
+    cursor = connection.cursor()
+    try:
+        for table in PARTITIONED_TABLES:
+            if table in skip:
+                continue
+            partition = partition_name(table, version)
+            state = partition_state(cursor, table, version)
+            if state is None:
+                cursor.execute(f"CREATE TABLE {partition} PARTITION OF {table} FOR VALUES IN (%s)", (version,))
+            elif state == 'detached':
+                cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES IN (%s)", (version,))
+                event('partition_attached', f"Attached {partition}", table=table, version=version)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def detach_partitions(cursor, version, tables=PARTITIONED_TABLES, drop=False):
+    """Detach the ``version`` partitions of ``tables``, referencing tables first.
+
+    A detached partition keeps copies of the parent's foreign keys, which
+    would still point at the (now smaller) parent tables; they are dropped
+    and PostgreSQL recreates them on ATTACH. With ``drop`` the partitions
+    are dropped instead, including ones that were already detached.
     """
-    for sample in nusc.sample:
-        cursor.execute(insert_sample_query, (
-            sample['token'],
-            sample['timestamp'],
-            sample['scene_token']
-        ))
-
-    update_sample_query = """
-    UPDATE sample
-    SET prev = %s, next = %s
-    WHERE token = %s
+    for table in reversed(PARTITIONED_TABLES):
+        state = partition_state(cursor, table, version)
+        if table not in tables or state is None:
+            continue
+        partition = partition_name(table, version)
+        if state == 'attached':
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {partition}")
+        if drop:
+            cursor.execute(f"DROP TABLE {partition}")
+            continue
+        cursor.execute("""
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f'
+        """, (partition,))
+        for (constraint,) in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {partition} DROP CONSTRAINT {constraint}")
+
+
+def detach_version(connection, version):
+    """Take ``version`` offline, keeping its partitions as standalone tables."""
+    cursor = connection.cursor()
+    try:
+        detach_partitions(cursor, version)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    event('version_detached', f"Detached {version} partitions", version=version)
+
+
+def stage_partitions(connection, version, tables):
+    """Create bare, unattached partitions of ``version`` for a fast load.
+
+    They copy the parent's columns and CHECK constraints but none of its
+    indexes or foreign keys; rows are copied straight into them and finish_staged() builds
+    the indexes and attaches them. Returns ``table -> staging table``.
     """
-    for sample in nusc.sample:
-        cursor.execute(update_sample_query, (
-            sample['prev'] if sample['prev'] else None,
-            sample['next'] if sample['next'] else None,
-            sample['token']
-        ))
-
-    print(f"Number of sample_annotation records: {len(nusc.sample_annotation)}")
-    insert_sample_annotation_query = """
-    INSERT INTO sample_annotation (token, sample_token, instance_token, visibility_token, translation, size, rotation, num_lidar_pts, num_radar_pts)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    staged = {}
+    cursor = connection.cursor()
+    try:
+        for spec in tables:
+            if spec.table not in PARTITIONED_TABLES:
+                continue
+            partition = partition_name(spec.table, version)
+            cursor.execute(f"CREATE TABLE {partition} (LIKE {spec.table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+            staged[spec.table] = partition
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return staged
+
+
+def set_maintenance_workers(cursor):
+    cursor.execute("SET max_parallel_maintenance_workers = %s", (maintenance_workers,))
+
+
+def finish_staged(connection, version, staged):
+    """Index the staged partitions and attach them, parents first.
+
+    Each partition gets the indexes of its parent built with parallel
+    maintenance workers before ATTACH, which then only has to validate
+    the partition bound and the foreign keys.
     """
-    for annotation in nusc.sample_annotation:
-        cursor.execute(insert_sample_annotation_query, (
-            annotation['token'],
-            annotation['sample_token'],
-            annotation['instance_token'],
-            annotation['visibility_token'],
-            json.dumps(annotation['translation']),
-            json.dumps(annotation['size']),
-            json.dumps(annotation['rotation']),
-            annotation['num_lidar_pts'],
-            annotation['num_radar_pts']
-        ))
-
-    update_sample_annotation_query = """
-    UPDATE sample_annotation
-    SET next = %s, prev = %s
-    WHERE token = %s
+    cursor = connection.cursor()
+    try:
+        set_maintenance_workers(cursor)
+        for table in PARTITIONED_TABLES:
+            if table not in staged:
+                continue
+            partition = staged[table]
+            start = time.perf_counter()
+            # Self-referencing foreign keys also point at the primary key
+            # index, so only primary key/unique constraints are joined
+            cursor.execute("""
+            SELECT pg_get_indexdef(i.indexrelid), c.contype, pg_get_constraintdef(c.oid)
+            FROM pg_index i
+            LEFT JOIN pg_constraint c ON c.conindid = i.indexrelid AND c.conrelid = i.indrelid
+                                     AND c.contype IN ('p', 'u')
+            WHERE i.indrelid = %s::regclass
+            """, (table,))
+            for index_def, contype, constraint_def in cursor.fetchall():
+                if contype in ('p', 'u'):
+                    cursor.execute(f"ALTER TABLE {partition} ADD {constraint_def}")
+                else:
+                    cursor.execute(re.sub(r'^CREATE (UNIQUE )?INDEX \S+ ON (ONLY )?\S+',
+                                          rf'CREATE \1INDEX ON {partition}', index_def))
+            connection.commit()
+            indexed = time.perf_counter()
+
+            cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES IN (%s)", (version,))
+            connection.commit()
+            attached = time.perf_counter()
+            event('partition_finished',
+                  f"Built {table} ({version}) indexes in {indexed - start:.2f}s, "
+                  f"attached and validated in {attached - indexed:.2f}s",
+                  table=table, version=version, index_seconds=round(indexed - start, 3),
+                  attach_seconds=round(attached - indexed, 3))
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def defer_constraints(connection, tables):
+    """Drop the foreign keys and secondary indexes of ``tables`` before a fast load.
+
+    Their definitions are saved in load_deferred_ddl in the same
+    transaction, so restore_deferred() can rebuild them even if the load
+    is interrupted. Primary keys stay, since other tables reference them.
     """
-    for annotation in nusc.sample_annotation:
-        cursor.execute(update_sample_annotation_query, (
-            annotation['next'] if annotation['next'] else None,
-            annotation['prev'] if annotation['prev'] else None,
-            annotation['token']
-        ))
-
-    print("Inserting sample_annotation records completed.")
-    connection.commit()
+    if not tables:
+        return
+    cursor = connection.cursor()
+    try:
+        cursor.execute("""
+        SELECT conrelid::regclass::text, conname, 'foreign key', pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE contype = 'f' AND conrelid = ANY(%s::regclass[])
+        UNION ALL
+        SELECT i.indrelid::regclass::text, c.relname, 'index', pg_get_indexdef(i.indexrelid)
+        FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = ANY(%s::regclass[])
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conindid = i.indexrelid AND k.conrelid = i.indrelid)
+        """, (list(tables), list(tables)))
+        for table, name, kind, definition in cursor.fetchall():
+            cursor.execute("""
+            INSERT INTO load_deferred_ddl (table_name, object_name, kind, definition)
+            VALUES (%s, %s, %s, %s)
+            """, (table, name, kind, definition))
+            if kind == 'index':
+                cursor.execute(f"DROP INDEX {name}")
+            else:
+                cursor.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def restore_deferred(connection):
+    """Rebuild what defer_constraints() dropped and report the time per table.
 
-    print(f"Number of attribute records: {len(nusc.attribute)}")
-    insert_attribute_query = """
-    INSERT INTO attribute (token, name, description)
-    VALUES (%s, %s, %s)
-    ON CONFLICT (token) DO NOTHING
+    Indexes are built first with parallel maintenance workers. Foreign
+    keys are added NOT VALID and then validated, which checks the loaded
+    rows in one pass instead of one lookup per inserted row.
     """
-    for attribute in nusc.attribute:
-        try:
-            cursor.execute(insert_attribute_query, (
-                attribute['token'],
-                attribute['name'],
-                attribute['description']
-            ))
-            print(f"Inserted attribute: {attribute['name']}")
-        except Exception as e:
-            print(f"Error inserting attribute {attribute['name']}: {e}")
-    
-    connection.commit()
-    print("Attribute records inserted successfully.")
+    cursor = connection.cursor()
+    try:
+        set_maintenance_workers(cursor)
+        cursor.execute("""
+        SELECT table_name, object_name, kind, definition FROM load_deferred_ddl
+        ORDER BY kind = 'foreign key', table_name
+        """)
+        deferred = cursor.fetchall()
+        timings = {}
+        for table, name, kind, definition in deferred:
+            start = time.perf_counter()
+            if kind == 'index':
+                cursor.execute(definition)
+            else:
+                cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition} NOT VALID")
+                cursor.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+            cursor.execute("DELETE FROM load_deferred_ddl WHERE table_name = %s AND object_name = %s",
+                           (table, name))
+            connection.commit()
+            timings.setdefault((table, kind), []).append(time.perf_counter() - start)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
 
-    print(f"Number of ego_pose records: {len(nusc.ego_pose)}")
-    insert_ego_pose_query = """
-    INSERT INTO ego_pose (token, translation, rotation, timestamp)
-    VALUES (%s, %s, %s, %s)
-    ON CONFLICT (token) DO NOTHING
+    for (table, kind), seconds in timings.items():
+        action = 'Built' if kind == 'index' else 'Validated'
+        event('deferred_restored',
+              f"{action} {len(seconds)} {table} {kind}{'es' if kind == 'index' else 's'} "
+              f"in {sum(seconds):.2f}s",
+              table=table, kind=kind, count=len(seconds), seconds=round(sum(seconds), 3))
+
+
+def find_dirty(connection, version, tables=TABLES):
+    """Work out which tables of ``version`` need (re)loading.
+
+    A table is reloaded when its source file hash differs from the one in
+    load_manifest or when it has no manifest row (never loaded, or the
+    previous run crashed before committing it). Tables referencing a
+    reloaded table are reloaded too. Returns ``(specs to reload, table ->
+    source hash)``; specs without a source file are included so that
+    their old rows are cleared, but they have no hash.
     """
-    for ego_pose in nusc.ego_pose:
-        try:
-            cursor.execute(insert_ego_pose_query, (
-                ego_pose['token'],
-                json.dumps(ego_pose['translation']),
-                json.dumps(ego_pose['rotation']),
-                ego_pose['timestamp']
-            ))
-            print(f"Inserted ego_pose: {ego_pose['token']}")
-        except Exception as e:
-            print(f"Error inserting ego_pose {ego_pose['token']}: {e}")
+    cursor = connection.cursor()
+    cursor.execute("SELECT table_name, source_hash FROM load_manifest WHERE dataset_version = %s",
+                   (version,))
+    manifest = dict(cursor.fetchall())
     connection.commit()
-    print("Ego pose records inserted successfully.")
+    cursor.close()
+
+    hashes = {}
+    dirty = set()
+    for spec in tables:
+        path = source_path(spec, version)
+        if not os.path.exists(path):
+            event('table_missing', f"{spec.table} data not available in {version}",
+                  table=spec.table, version=version)
+            continue
+        hashes[spec.table] = file_hash(path)
+        if manifest.get(spec.table) != hashes[spec.table]:
+            dirty.add(spec.table)
+
+    for table in list(dirty):
+        dirty |= descendants(table, tables)
+
+    for spec in tables:
+        if spec.table in hashes and spec.table not in dirty:
+            event('table_skipped', f"{spec.table} ({version}) unchanged since last load, skipping",
+                  table=spec.table, version=version)
+
+    return [spec for spec in tables if spec.table in dirty], hashes
+
+
+def clear_tables(connection, version, tables):
+    """Empty the given tables of ``version`` before they are reloaded.
+
+    Their partitions are dropped and the rows of the other tables deleted,
+    referencing tables first, in the same transaction as the manifest and
+    quarantine cleanup and before any data is written, so an interrupted
+    load resumes from the last committed table.
+    """
+    names = {spec.table for spec in tables}
+    cursor = connection.cursor()
+    try:
+        detach_partitions(cursor, version, names, drop=True)
+        for spec in reversed(TABLES):
+            if spec.table in names and spec.table not in PARTITIONED_TABLES:
+                cursor.execute(f"DELETE FROM {spec.table} WHERE dataset_version = %s", (version,))
+        cursor.execute("DELETE FROM load_manifest WHERE dataset_version = %s AND table_name = ANY(%s)",
+                       (version, sorted(names)))
+        cursor.execute("DELETE FROM load_quarantine WHERE dataset_version = %s AND table_name = ANY(%s)",
+                       (version, sorted(names)))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
 
-    print(f"Number of calibrated_sensor records: {len(nusc.calibrated_sensor)}")
-    insert_calibrated_sensor_query = """
-    INSERT INTO calibrated_sensor (token, sensor_token, translation, rotation, camera_intrinsic)
-    VALUES (%s, %s, %s, %s, %s)
-    ON CONFLICT (token) DO NOTHING
+def plan_load(connection, version, tables=TABLES):
+    """Find the tables of ``version`` to reload and empty them.
+
+    Returns ``(specs to load, table -> source hash)``.
     """
-    for calibrated_sensor in nusc.calibrated_sensor:
-        try:
-            cursor.execute(insert_calibrated_sensor_query, (
-                calibrated_sensor['token'],
-                calibrated_sensor['sensor_token'],
-                json.dumps(calibrated_sensor['translation']),
-                json.dumps(calibrated_sensor['rotation']),
-                json.dumps(calibrated_sensor['camera_intrinsic']) if calibrated_sensor['camera_intrinsic'] else None
-            ))
-            print(f"Inserted calibrated_sensor: {calibrated_sensor['token']}")
-        except Exception as e:
-            print(f"Error inserting calibrated_sensor {calibrated_sensor['token']}: {e}")
-    connection.commit()
-    print("Calibrated sensor records inserted successfully.")
+    dirty, hashes = find_dirty(connection, version, tables)
+    clear_tables(connection, version, dirty)
+    return [spec for spec in dirty if spec.table in hashes], hashes
 
-    # Disable foreign key constraint temporarily
-    cursor.execute("ALTER TABLE sample_data DROP CONSTRAINT IF EXISTS sample_data_next_fkey;")
-    connection.commit()
 
-    print(f"Number of sample_data records: {len(nusc.sample_data)}")
-    insert_sample_data_query = """
-    INSERT INTO sample_data (
-        token, sample_token, ego_pose_token, calibrated_sensor_token,
-        timestamp, fileformat, is_key_frame, height, width, filename,
-        prev, next
-    ) VALUES (
-        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-    )
+def load_table(connection, spec, version, records, source_hash, target=None, check=None):
+    """Load one table of ``version`` in a single transaction and report its row rate.
+
+    prev/next links are written in the same pass; the self-referencing
+    foreign keys are deferred, so they are checked once at commit. The
+    load_manifest checkpoint commits with the data. Rows go to ``target``
+    (a staged partition) when given, otherwise to the spec's table. With
+    a validation ``check`` the rejected rows go to load_quarantine instead.
+    Returns ``(rows, seconds)``.
     """
-    
-    print(f"Number of sample_data records to process: {len(nusc.sample_data)}")
-    for sample_data in nusc.sample_data:
-        try:
-            cursor.execute(insert_sample_data_query, (
-                sample_data['token'],
-                sample_data['sample_token'],
-                sample_data['ego_pose_token'],
-                sample_data['calibrated_sensor_token'],
-                sample_data['timestamp'],
-                sample_data['fileformat'],
-                sample_data['is_key_frame'],
-                sample_data['height'],
-                sample_data['width'], 
-                sample_data['filename'],
-                sample_data['prev'],
-                sample_data['next'] if sample_data['next'] else None
-            ))
-            connection.commit()
-            
-        except Exception as e:
-            print(f"Error processing {sample_data['token']}: {str(e)}")
-            print("Data:", {k: v for k, v in sample_data.items() if k != 'data'})
-            connection.rollback()
+    progress = TableProgress(spec.table, version)
+    cursor = connection.cursor()
+    try:
+        if check is not None:
+            records = check.filter(records)
+        columns = spec.columns + ('dataset_version',)
+        rows = (spec.row(record) + (version,) for record in records)
+        count = copy_rows(cursor, target or spec.table, columns, rows, progress=progress)
+        if check is not None and check.rejected:
+            copy_rows(cursor, 'load_quarantine',
+                      ('dataset_version', 'table_name', 'token', 'reason', 'record'),
+                      ((version, spec.table, token, reason, json.dumps(record))
+                       for token, reason, record in check.quarantine()))
+        cursor.execute("""
+        INSERT INTO load_manifest (dataset_version, table_name, source_hash, row_count, loaded_at)
+        VALUES (%s, %s, %s, %s, now())
+        ON CONFLICT (dataset_version, table_name) DO UPDATE
+        SET source_hash = EXCLUDED.source_hash, row_count = EXCLUDED.row_count, loaded_at = EXCLUDED.loaded_at
+        """, (version, spec.table, source_hash, count))
+        connection.commit()
+    except Exception as error:
+        connection.rollback()
+        progress.fail(error)
+        raise
+    finally:
+        cursor.close()
 
-    # Re-enable foreign key constraint after all inserts
-    cursor.execute("""
-    ALTER TABLE sample_data 
-    ADD CONSTRAINT sample_data_next_fkey 
-    FOREIGN KEY (next) 
-    REFERENCES sample_data(token)
-    DEFERRABLE INITIALLY DEFERRED;
-    """)
-    connection.commit()
+    return progress.finish()
 
-    # Verify the insertions
-    cursor.execute("SELECT COUNT(*) FROM sample_data")
-    count = cursor.fetchone()[0]
-    print(f"Total sample_data records in database: {count}")
 
-    print(f"Number of map records: {len(nusc.map)}")
-    insert_map_query = """
-    INSERT INTO map (token, log_tokens, category, filename)
-    VALUES (%s, %s, %s, %s)
-    ON CONFLICT (token) DO NOTHING
+def load_tables(tables, version, hashes, workers=None, targets=None, checks=None):
+    """Load ``tables`` over a pool of connections, respecting dependencies.
+
+    A table is started as soon as every table it references has been
+    committed, so independent tables (log, sensor, ego_pose, ...) load at
+    the same time. ``workers=1`` gives the serial path. ``targets`` maps
+    tables to the staged partitions they load into and ``checks`` to their
+    validation results. Returns a dict of
+    ``table -> (rows, seconds)``.
     """
-    for map_data in nusc.map:
+    workers = workers or load_workers
+    targets = targets or {}
+    checks = checks or {}
+    specs = {spec.table: spec for spec in tables}
+    pending = list(specs)
+    done = set()
+    results = {}
+
+    pool = ThreadedConnectionPool(1, workers, host=host, port=port, database=database,
+                                  user=user, password=password, options=session_options)
+
+    def run(spec):
+        connection = pool.getconn()
         try:
-            cursor.execute(insert_map_query, (
-                map_data['token'],
-                map_data['log_tokens'],
-                map_data['category'],
-                map_data['filename']
-            ))
-            print(f"Inserted map: {map_data['token']}")
-        except Exception as e:
-            print(f"Error inserting map {map_data['token']}: {e}")
+            records = iter_table(dataroot, version, spec.source)
+            return load_table(connection, spec, version, records, hashes[spec.table],
+                              targets.get(spec.table), checks.get(spec.table))
+        finally:
+            pool.putconn(connection)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            running = {}
+            while pending or running:
+                for table in list(pending):
+                    spec = specs[table]
+                    if not all(dep in done or dep not in specs for dep in spec.depends_on):
+                        continue
+                    pending.remove(table)
+                    running[executor.submit(run, spec)] = table
+
+                if not running:
+                    if pending:
+                        raise RuntimeError(f"Unresolvable table dependencies: {', '.join(pending)}")
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    table = running.pop(future)
+                    # Re-raises the table's error; queued work is not started
+                    results[table] = future.result()
+                    done.add(table)
+    finally:
+        pool.closeall()
+
+    return results
+
+
+def notify_reload(connection, version):
+    cursor = connection.cursor()
+    cursor.execute("SELECT pg_notify(%s, %s)", (reload_channel, version))
     connection.commit()
-    print("Map records inserted successfully.")
-
-    if hasattr(nusc, 'lidarseg'):
-        print(f"Number of lidarseg records: {len(nusc.lidarseg)}")
-        insert_lidarseg_query = """
-        INSERT INTO lidarseg (token, filename, sample_data_token)
-        VALUES (%s, %s, %s)
-        """
-        for lidarseg in nusc.lidarseg:
-            cursor.execute(insert_lidarseg_query, (
-                lidarseg['token'],
-                lidarseg['filename'],
-                lidarseg['sample_data_token']
-            ))
-    else:
-        print("Lidarseg data not available in this dataset")
-
-except Exception as error:
-    print(f"An error occurred: {error}")
-    connection.rollback()
-
-finally:
-    if cursor is not None:
-        cursor.close()
-    if connection is not None:
-        connection.close()
+    cursor.close()
+
+
+def load_version(connection, version):
+    dirty, hashes = find_dirty(connection, version)
+    tables = [spec for spec in dirty if spec.table in hashes]
+    # Check the foreign keys of the new rows before anything is deleted or written
+    checks = {}
+    if tables and load_validation.validation_mode != 'off':
+        checks = load_validation.validate_version(
+            connection, version, tables, TABLES, lambda spec: iter_table(dataroot, version, spec.source))
+    clear_tables(connection, version, dirty)
+    # Finish a fast load that was interrupted before its rebuild, now that
+    # the rows of any table being reloaded are gone
+    restore_deferred(connection)
+    staged = {}
+    if fast_load and tables:
+        staged = stage_partitions(connection, version, tables)
+        defer_constraints(connection, [spec.table for spec in tables if spec.table not in staged])
+    attach_version(connection, version, skip=staged)
+    if not tables:
+        event('version_up_to_date', f"All {version} tables are up to date", version=version)
+        scene_summary.refresh(connection, version)
+        return
+
+    load_start = time.perf_counter()
+    results = load_tables(tables, version, hashes, targets=staged, checks=checks)
+    if fast_load:
+        post_load_start = time.perf_counter()
+        finish_staged(connection, version, staged)
+        restore_deferred(connection)
+        rebuild = time.perf_counter() - post_load_start
+        event('version_rebuilt', f"Rebuilt {version} indexes and constraints in {rebuild:.2f}s",
+              version=version, seconds=round(rebuild, 3))
+    elapsed = time.perf_counter() - load_start
+
+    total_rows = sum(rows for rows, _ in results.values())
+    # Per-table times overlap and slow each other down when tables load in
+    # parallel, so their sum is no estimate of a serial load; benchmark.py
+    # measures the real speedup against the serial strategy
+    table_seconds = sum(seconds for _, seconds in results.values())
+    event('version_loaded',
+          f"Loaded {total_rows} {version} records in {elapsed:.2f}s with {load_workers} workers "
+          f"(summed table time {table_seconds:.2f}s)",
+          version=version, tables=len(results), rows=total_rows, seconds=round(elapsed, 3),
+          rows_per_sec=round(total_rows / elapsed, 1) if elapsed > 0 else None,
+          table_seconds=round(table_seconds, 3), workers=load_workers)
+    scene_summary.refresh(connection, version,
+                          full=any(spec.table in scene_summary.SOURCE_TABLES for spec in dirty))
+    notify_reload(connection, version)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load nuScenes JSON tables into PostgreSQL")
+    parser.add_argument('--detach', metavar='VERSION',
+                        help="detach the partitions of VERSION instead of loading")
+    parser.add_argument('--attach', metavar='VERSION',
+                        help="re-attach the partitions of VERSION instead of loading")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    configure_logging()
+    connection = None
+    cursor = None
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+
+        with open(sql_file_path, 'r') as file:
+            sql_commands = file.read()
+        if reset:
+            reset_schema(connection)
+        cursor.execute(sql_commands)
+        connection.commit()
+        migrations.migrate(connection)
+
+        if args.detach:
+            detach_version(connection, args.detach)
+            notify_reload(connection, args.detach)
+        elif args.attach:
+            attach_version(connection, args.attach)
+            notify_reload(connection, args.attach)
+        else:
+            for version in versions:
+                load_version(connection, version)
+
+    except Exception as error:
+        event('load_failed', f"An error occurred: {error}", level=logging.ERROR, error=str(error))
+        if connection is not None:
+            connection.rollback()
+
+    finally:
+        if cursor is not None:
+            cursor.close()
+        if connection is not None:
+            connection.close()
+
 
+if __name__ == '__main__':
+    main()
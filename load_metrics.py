@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger('nuscenes.loader')
+
+# LOG_FORMAT=json writes one JSON object per line instead of plain text
+log_format = os.getenv('LOG_FORMAT', 'text')
+log_level = os.getenv('LOG_LEVEL', 'INFO')
+# Seconds between progress reports of a running table (0 disables them)
+progress_interval = float(os.getenv('PROGRESS_INTERVAL', '5'))
+
+# LogRecord attributes that are not event fields
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats a record as ``{"time", "level", "event", "message", ...fields}``."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RESERVED)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(stream=None):
+    """Send loader events to ``stream`` (stdout) in the LOG_FORMAT format."""
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if log_format == 'json':
+        handler.setFormatter(JsonLinesFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.handlers[:] = [handler]
+    logger.setLevel(log_level.upper())
+    logger.propagate = False
+
+
+def event(name, message, level=logging.INFO, **fields):
+    """Log ``message`` with an ``event`` name and fields for the JSON output."""
+    logger.log(level, message, extra={'event': name, **fields})
+
+
+class TableProgress:
+    """Row counts, errors and timing of one table load.
+
+    ``advance`` is called once per COPY batch, not per row, and reports
+    progress at most every ``interval`` seconds.
+    """
+
+    def __init__(self, table, version, interval=None):
+        self.table = table
+        self.version = version
+        self.interval = progress_interval if interval is None else interval
+        self.rows = 0
+        self.errors = 0
+        self.start = time.perf_counter()
+        self._reported = self.start
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    @property
+    def rate(self):
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed > 0 else float(self.rows)
+
+    def advance(self, rows):
+        self.rows += rows
+        now = time.perf_counter()
+        if self.interval and now - self._reported >= self.interval:
+            self._reported = now
+            event('table_progress',
+                  f"{self.table} ({self.version}): {self.rows} rows in {now - self.start:.1f}s "
+                  f"({self.rate:,.0f} rows/s)",
+                  table=self.table, version=self.version, rows=self.rows,
+                  seconds=round(now - self.start, 3), rows_per_sec=round(self.rate, 1))
+
+    def finish(self):
+        elapsed = self.elapsed
+        event('table_loaded',
+              f"Loaded {self.rows} {self.table} ({self.version}) records in {elapsed:.2f}s "
+              f"({self.rate:,.0f} rows/s)",
+              table=self.table, version=self.version, rows=self.rows, seconds=round(elapsed, 3),
+              rows_per_sec=round(self.rate, 1), errors=self.errors)
+        return self.rows, elapsed
+
+    def fail(self, error):
+        self.errors += 1
+        event('table_failed', f"Loading {self.table} ({self.version}) failed after {self.rows} rows: {error}",
+              level=logging.ERROR, table=self.table, version=self.version, rows=self.rows,
+              seconds=round(self.elapsed, 3), errors=self.errors, error=str(error))
+
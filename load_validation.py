@@ -0,0 +1,191 @@
+import logging
+import os
+from collections import Counter, defaultdict
+
+from load_metrics import event
+
+# VALIDATION_MODE=fail stops the load before anything is written when rows
+# break a foreign key, quarantine loads the valid rows and moves the others
+# to load_quarantine, off skips the check
+validation_mode = os.getenv('VALIDATION_MODE', 'fail')
+
+# Foreign keys of nuScene.sql as (column, referenced table)
+REFERENCES = {
+    'instance': (('category_token', 'category'),),
+    'scenes': (('log_token', 'log'),),
+    'sample': (('scene_token', 'scenes'), ('next', 'sample'), ('prev', 'sample')),
+    'sample_annotation': (('sample_token', 'sample'), ('instance_token', 'instance'),
+                          ('visibility_token', 'visibility'),
+                          ('next', 'sample_annotation'), ('prev', 'sample_annotation')),
+    'calibrated_sensor': (('sensor_token', 'sensor'),),
+    'sample_data': (('sample_token', 'sample'), ('ego_pose_token', 'ego_pose'),
+                    ('calibrated_sensor_token', 'calibrated_sensor'), ('next', 'sample_data')),
+    'lidarseg': (('sample_data_token', 'sample_data'),),
+}
+
+# Orphan tokens listed per foreign key in the report
+EXAMPLES = 5
+
+
+class ValidationError(ValueError):
+    pass
+
+
+class TableCheck:
+    """Outcome of validating one source table.
+
+    ``rejected`` maps record positions to ``(token, reason)``, ``records``
+    holds the rejected source records for the quarantine table and
+    ``removed`` the tokens that will not be loaded, so that linked-list
+    pointers to them (prev/next) can be cleared instead of rejecting the
+    whole chain.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.tokens = set()
+        self.rejected = {}
+        self.records = {}
+        self.removed = set()
+        self.orphans = Counter()
+        self.examples = defaultdict(list)
+        self.self_links = tuple(column for column, table in REFERENCES.get(spec.table, ()) if table == spec.table)
+
+    def reject(self, index, token, reason, key, record=None):
+        self.rejected[index] = (token, reason)
+        if record is not None:
+            self.records[index] = record
+        self.orphans[key] += 1
+        if len(self.examples[key]) < EXAMPLES:
+            self.examples[key].append(token)
+
+    def filter(self, records):
+        """Yield the loadable records, dropping rejected ones and clearing
+        self-referencing links to rows that are not loaded."""
+        for index, record in enumerate(records):
+            if index in self.rejected:
+                continue
+            cleared = [column for column in self.self_links if record.get(column) in self.removed]
+            if cleared:
+                record = dict(record, **{column: None for column in cleared})
+            yield record
+
+    def quarantine(self):
+        """``(token, reason, record)`` of every rejected row."""
+        return [(token, reason, self.records[index]) for index, (token, reason) in self.rejected.items()]
+
+
+def validate_table(spec, records, known):
+    """Check every row of ``spec`` against the token sets in ``known``.
+
+    Foreign keys to other tables are checked as the rows stream past.
+    Self-referencing links may point forward in the file, so unresolved
+    targets are kept until the token shows up; whatever is left at the
+    end points at a row that is not in the source at all. A row pointing
+    at a row that was itself rejected keeps loading with the link cleared.
+    """
+    check = TableCheck(spec)
+    columns = {column: i for i, column in enumerate(spec.columns)}
+    external = [(columns[column], column, table) for column, table in REFERENCES.get(spec.table, ())
+                if table != spec.table]
+    self_links = [(columns[column], column) for column in check.self_links]
+    pending = defaultdict(list)
+
+    for index, record in enumerate(records):
+        row = spec.row(record)
+        token = row[0]
+        if token in check.tokens:
+            check.reject(index, token, f"duplicate token {token}", ('token', spec.table), record)
+            continue
+
+        orphan = next(((column, table, row[i]) for i, column, table in external
+                       if row[i] is not None and row[i] not in known[table]), None)
+        if orphan:
+            column, table, value = orphan
+            check.reject(index, token, f"{column} {value} not found in {table}", (column, table), record)
+            check.removed.add(token)
+            continue
+
+        check.tokens.add(token)
+        pending.pop(token, None)
+        for i, column in self_links:
+            target = row[i]
+            if target is not None and target not in check.tokens:
+                pending[target].append((index, token, column))
+
+    for target, referrers in pending.items():
+        if target in check.removed:
+            continue
+        for index, token, column in referrers:
+            if index in check.rejected:
+                continue
+            check.reject(index, token, f"{column} {target} not found in {spec.table}", (column, spec.table))
+            check.tokens.discard(token)
+            check.removed.add(token)
+    return check
+
+
+def fetch_tokens(connection, table, token_column, version):
+    """Tokens of an already loaded table, streamed with a server-side cursor."""
+    cursor = connection.cursor(name=f'validate_{table}')
+    cursor.itersize = 100000
+    try:
+        cursor.execute(f"SELECT {token_column} FROM {table} WHERE dataset_version = %s", (version,))
+        return {token for token, in cursor}
+    finally:
+        cursor.close()
+        connection.commit()
+
+
+def validate_version(connection, version, tables, specs, read_records):
+    """Validate the source rows of ``tables`` (the specs being loaded).
+
+    Tables referenced by them but not being loaded are read from the
+    database. ``specs`` are all table specs in dependency order and
+    ``read_records(spec)`` streams a table's source records. Orphans are
+    reported in bulk; in fail mode a ValidationError is raised once every
+    table has been checked. Returns ``table -> TableCheck``.
+    """
+    loading = {spec.table for spec in tables}
+    token_columns = {spec.table: spec.columns[0] for spec in specs}
+    needed = Counter(table for spec in tables for _, table in REFERENCES.get(spec.table, ()))
+    known = {}
+    checks = {}
+
+    for spec in tables:
+        for _, table in REFERENCES.get(spec.table, ()):
+            if table not in known and table != spec.table and table not in loading:
+                known[table] = fetch_tokens(connection, table, token_columns[table], version)
+
+        check = validate_table(spec, read_records(spec), known)
+        known[spec.table], check.tokens = check.tokens, None
+        checks[spec.table] = check
+
+        # Keep only the token sets later tables still refer to
+        for _, table in REFERENCES.get(spec.table, ()):
+            needed[table] -= 1
+        for table in [table for table in known if needed[table] <= 0]:
+            del known[table]
+
+        if check.rejected and len(check.records) < len(check.rejected):
+            for index, record in enumerate(read_records(spec)):
+                if index in check.rejected and index not in check.records:
+                    check.records[index] = record
+
+    failed = 0
+    for table, check in checks.items():
+        for (column, referenced), count in check.orphans.items():
+            failed += count
+            problem = 'a duplicate token' if column == 'token' else f"{column} not found in {referenced}"
+            event('validation_orphans',
+                  f"{table} ({version}): {count} rows with {problem}, "
+                  f"e.g. {', '.join(check.examples[(column, referenced)])}",
+                  level=logging.WARNING, table=table, version=version, column=column,
+                  referenced_table=referenced, rows=count, examples=check.examples[(column, referenced)])
+    event('validation_finished', f"Validated {len(checks)} {version} tables, {failed} invalid rows",
+          version=version, tables=len(checks), invalid_rows=failed)
+
+    if failed and validation_mode == 'fail':
+        raise ValidationError(f"{failed} {version} rows break foreign keys; fix the source data or "
+                              f"set VALIDATION_MODE=quarantine to load the valid rows")
+    return checks
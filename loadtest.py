@@ -0,0 +1,111 @@
+"""API load test: sends the same request mix at increasing concurrency and
+reports throughput and latency per level, so it is visible whether
+concurrent requests overlap or queue behind each other.
+
+Start the API first (e.g. `uvicorn api:app`), then:
+
+    python loadtest.py
+    python loadtest.py --concurrency 1,8,32 --requests 500 --min-speedup 3
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Request mix: a list endpoint, the precomputed summaries and spatial queries
+DEFAULT_PATHS = [
+    '/samples',
+    '/scene_summaries',
+    '/category_summaries',
+    '/spatial/sample_annotations/nearest?x=0&y=0&k=50',
+    '/spatial/ego_poses/radius?x=0&y=0&radius=50',
+]
+
+
+def fetch(url):
+    """(status, seconds) of one GET; the body is read and discarded."""
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=60) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as error:
+        status = error.code
+    except OSError:
+        status = None
+    return status, time.perf_counter() - start
+
+
+def run_level(urls, concurrency, requests):
+    """Send ``requests`` GETs over ``concurrency`` threads, cycling through ``urls``."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(fetch, (urls[i % len(urls)] for i in range(requests))))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(seconds for _, seconds in results)
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': sum(1 for status, _ in results if status != 200),
+        'seconds': round(elapsed, 3),
+        'requests_per_sec': round(requests / elapsed, 1),
+        'p50_ms': round(1000 * statistics.median(latencies), 2),
+        'p95_ms': round(1000 * latencies[int(0.95 * (len(latencies) - 1))], 2),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test the nuScenes API")
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help="API base URL")
+    parser.add_argument('--version', help="dataset version passed as ?version=")
+    parser.add_argument('--paths', default=','.join(DEFAULT_PATHS),
+                        help="comma separated request paths, sent round-robin")
+    parser.add_argument('--concurrency', default='1,2,4,8,16',
+                        help="comma separated numbers of concurrent clients")
+    parser.add_argument('--requests', type=int, default=200, help="requests per concurrency level")
+    parser.add_argument('--min-speedup', type=float,
+                        help="exit with status 1 if the highest level is not this many times "
+                             "faster than the lowest")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    urls = []
+    for path in args.paths.split(','):
+        path = path.strip()
+        if args.version:
+            path += ('&' if '?' in path else '?') + f"version={args.version}"
+        urls.append(args.url.rstrip('/') + path)
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    # Warm up the pool and the server's caches
+    run_level(urls, max(levels), len(urls) * max(levels))
+    results = [run_level(urls, level, args.requests) for level in levels]
+    base = results[0]['requests_per_sec']
+    for result in results:
+        result['speedup'] = round(result['requests_per_sec'] / base, 2) if base else None
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'clients':>8} {'req/s':>10} {'speedup':>8} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+        for result in results:
+            print(f"{result['concurrency']:>8} {result['requests_per_sec']:>10.1f} {result['speedup']:>8.2f} "
+                  f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['errors']:>7}")
+
+    if any(result['errors'] for result in results):
+        print("Some requests failed", file=sys.stderr)
+    if args.min_speedup and results[-1]['speedup'] < args.min_speedup:
+        print(f"Throughput with {results[-1]['concurrency']} clients is only {results[-1]['speedup']}x "
+              f"that of {results[0]['concurrency']} (expected {args.min_speedup}x)", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,478 @@
+"""Schema migrations applied on top of nuScene.sql.
+
+nuScene.sql creates missing tables; changes to tables that may already
+hold data (indexes, ...) go here so existing databases pick them up too.
+Applied migrations are recorded in schema_migrations. dbconnect.py runs
+them after nuScene.sql; they can also be applied by hand:
+
+    python migrations.py
+    python migrations.py --check v1.0-mini   # EXPLAIN the API/GUI access paths
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+import psycopg2
+from dotenv import load_dotenv
+from load_metrics import configure_logging, event
+
+load_dotenv()
+
+# Foreign key columns looked up by the API filters and by the checks
+# PostgreSQL runs when a referenced row is deleted. Partitioned tables hold
+# one version per partition, so these lookups leave out dataset_version: it
+# only filters the few rows an index lookup finds. (The page indexes of
+# FILTER_INDEXES do lead with it, see there.)
+FOREIGN_KEY_INDEXES = [
+    ('instance', ('dataset_version', 'category_token')),
+    ('scenes', ('dataset_version', 'log_token')),
+    ('sample', ('dataset_version', 'scene_token')),
+    ('calibrated_sensor', ('dataset_version', 'sensor_token')),
+    ('sample_data', ('sample_token',)),
+    ('sample_data', ('calibrated_sensor_token',)),
+    ('sample_data', ('ego_pose_token',)),
+    ('sample_annotation', ('sample_token',)),
+    ('sample_annotation', ('instance_token',)),
+    ('lidarseg', ('sample_data_token',)),
+]
+
+# Timestamps grow with the physical row order of a load, so a BRIN index
+# answers time ranges at a fraction of a B-tree's size
+TIMESTAMP_TABLES = ['sample', 'sample_data', 'ego_pose']
+
+# Map frame x/y position of annotations and ego poses, as used by the
+# spatial API queries. An expression index keeps translation the only copy.
+POSITION = "point(translation[1], translation[2])"
+SPATIAL_TABLES = ['sample_annotation', 'ego_pose']
+
+# Columns of the list endpoint filters that are not foreign keys of the
+# previous migrations: (index name, table, columns, predicate of a partial
+# index). List pages are read in token order after dataset_version = %s,
+# which the planner keeps as an index condition even on a one-version
+# partition. Only an index on dataset_version, the equality filters and
+# then token returns such a page without a sort and beats the primary key,
+# so unlike the foreign key lookups these include dataset_version.
+FILTER_INDEXES = [
+    ('sample_annotation_visibility_page_idx', 'sample_annotation', 'dataset_version, visibility_token, token', None),
+    ('sample_annotation_num_lidar_pts_idx', 'sample_annotation', 'num_lidar_pts', None),
+    ('sample_data_key_frame_page_idx', 'sample_data', 'dataset_version, token', 'is_key_frame'),
+]
+
+# (id, statements), applied in order
+MIGRATIONS = [
+    ('001_foreign_key_indexes', [
+        f"CREATE INDEX IF NOT EXISTS {table}_{columns[-1]}_idx ON {table} ({', '.join(columns)})"
+        for table, columns in FOREIGN_KEY_INDEXES
+    ]),
+    ('002_timestamp_brin_indexes', [
+        f"CREATE INDEX IF NOT EXISTS {table}_timestamp_brin ON {table} USING brin (timestamp)"
+        for table in TIMESTAMP_TABLES
+    ]),
+    ('003_position_gist_indexes', [
+        f"CREATE INDEX IF NOT EXISTS {table}_position_gist ON {table} USING gist (({POSITION}))"
+        for table in SPATIAL_TABLES
+    ]),
+    ('004_scene_summaries', [
+        """
+        CREATE TABLE IF NOT EXISTS scene_summary (
+            dataset_version VARCHAR(32) NOT NULL,
+            scene_token UUID NOT NULL,
+            sample_count INTEGER NOT NULL,
+            annotation_count INTEGER NOT NULL,
+            lidar_pts BIGINT NOT NULL,
+            radar_pts BIGINT NOT NULL,
+            first_timestamp BIGINT,
+            last_timestamp BIGINT,
+            refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (dataset_version, scene_token)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS scene_category_summary (
+            dataset_version VARCHAR(32) NOT NULL,
+            scene_token UUID NOT NULL,
+            category_token UUID NOT NULL,
+            annotation_count INTEGER NOT NULL,
+            lidar_pts BIGINT NOT NULL,
+            radar_pts BIGINT NOT NULL,
+            PRIMARY KEY (dataset_version, scene_token, category_token)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS scene_summary_stale (
+            dataset_version VARCHAR(32) NOT NULL,
+            scene_token UUID NOT NULL,
+            PRIMARY KEY (dataset_version, scene_token)
+        )
+        """,
+        # Queue the scenes of rows changed outside the loader; the loader
+        # sets nuscenes.loading and refreshes whole versions itself
+        """
+        CREATE OR REPLACE FUNCTION queue_scene_summary() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('nuscenes.loading', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_ARGV[0] = 'sample' THEN
+                INSERT INTO scene_summary_stale (dataset_version, scene_token)
+                SELECT DISTINCT v, s FROM (VALUES (OLD.dataset_version, OLD.scene_token),
+                                                  (NEW.dataset_version, NEW.scene_token)) AS t (v, s)
+                WHERE s IS NOT NULL
+                ON CONFLICT DO NOTHING;
+            ELSIF TG_ARGV[0] = 'sample_annotation' THEN
+                INSERT INTO scene_summary_stale (dataset_version, scene_token)
+                SELECT DISTINCT s.dataset_version, s.scene_token FROM sample s
+                WHERE (s.dataset_version, s.token) IN ((OLD.dataset_version, OLD.sample_token),
+                                                       (NEW.dataset_version, NEW.sample_token))
+                ON CONFLICT DO NOTHING;
+            ELSE
+                INSERT INTO scene_summary_stale (dataset_version, scene_token)
+                SELECT DISTINCT s.dataset_version, s.scene_token
+                FROM sample_annotation sa
+                JOIN sample s ON s.dataset_version = sa.dataset_version AND s.token = sa.sample_token
+                WHERE sa.dataset_version = NEW.dataset_version AND sa.instance_token = NEW.token
+                ON CONFLICT DO NOTHING;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE TRIGGER sample_queue_scene_summary AFTER INSERT OR UPDATE OR DELETE ON sample
+        FOR EACH ROW EXECUTE FUNCTION queue_scene_summary('sample')
+        """,
+        """
+        CREATE TRIGGER sample_annotation_queue_scene_summary AFTER INSERT OR UPDATE OR DELETE ON sample_annotation
+        FOR EACH ROW EXECUTE FUNCTION queue_scene_summary('sample_annotation')
+        """,
+        """
+        CREATE TRIGGER instance_queue_scene_summary AFTER UPDATE OF category_token ON instance
+        FOR EACH ROW EXECUTE FUNCTION queue_scene_summary('instance')
+        """,
+    ]),
+    ('005_filter_indexes', [
+        f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})" + (f" WHERE {predicate}" if predicate else "")
+        for name, table, columns, predicate in FILTER_INDEXES
+    ]),
+    ('006_bundle_changes', [
+        """
+        CREATE TABLE IF NOT EXISTS scene_changes (
+            dataset_version VARCHAR(32) NOT NULL,
+            scene_token UUID NOT NULL,
+            changes BIGINT NOT NULL,
+            PRIMARY KEY (dataset_version, scene_token)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS table_changes (
+            dataset_version VARCHAR(32) NOT NULL,
+            table_name VARCHAR(64) NOT NULL,
+            changes BIGINT NOT NULL,
+            PRIMARY KEY (dataset_version, table_name)
+        )
+        """,
+        # Count the edits made outside the loader (loads are recorded in
+        # load_manifest): per scene for the rows of one scene, per table
+        # for the rows that scenes share
+        """
+        CREATE OR REPLACE FUNCTION count_bundle_change() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('nuscenes.loading', true) = 'on' THEN
+                RETURN NULL;
+            END IF;
+            IF TG_ARGV[0] IN ('scenes', 'sample') THEN
+                INSERT INTO scene_changes (dataset_version, scene_token, changes)
+                SELECT DISTINCT v, s, 1 FROM (VALUES (OLD.dataset_version, OLD.scene_token),
+                                                     (NEW.dataset_version, NEW.scene_token)) AS t (v, s)
+                WHERE s IS NOT NULL
+                ON CONFLICT (dataset_version, scene_token) DO UPDATE SET changes = scene_changes.changes + 1;
+            ELSIF TG_ARGV[0] IN ('sample_data', 'sample_annotation') THEN
+                INSERT INTO scene_changes (dataset_version, scene_token, changes)
+                SELECT DISTINCT s.dataset_version, s.scene_token, 1 FROM sample s
+                WHERE (s.dataset_version, s.token) IN ((OLD.dataset_version, OLD.sample_token),
+                                                       (NEW.dataset_version, NEW.sample_token))
+                ON CONFLICT (dataset_version, scene_token) DO UPDATE SET changes = scene_changes.changes + 1;
+            ELSE
+                INSERT INTO table_changes (dataset_version, table_name, changes)
+                SELECT DISTINCT v, TG_ARGV[0], 1 FROM (VALUES (OLD.dataset_version), (NEW.dataset_version)) AS t (v)
+                WHERE v IS NOT NULL
+                ON CONFLICT (dataset_version, table_name) DO UPDATE SET changes = table_changes.changes + 1;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+    ] + [
+        f"CREATE TRIGGER {table}_count_bundle_change AFTER INSERT OR UPDATE OR DELETE ON {table} "
+        f"FOR EACH ROW EXECUTE FUNCTION count_bundle_change('{table}')"
+        for table in ('scenes', 'sample', 'sample_data', 'sample_annotation',
+                      'ego_pose', 'calibrated_sensor', 'instance', 'category')
+    ]),
+]
+
+# The location scope of the spatial queries, as api.py's IN_LOCATION sends it,
+# and the location of a sample_annotation / ego_pose row as a parameter
+LOG_OF_SAMPLE = """JOIN scenes sc ON sc.dataset_version = s.dataset_version AND sc.scene_token = s.scene_token
+    JOIN log l ON l.dataset_version = sc.dataset_version AND l.token = sc.log_token"""
+ANNOTATION_IN_LOCATION = f"""EXISTS (SELECT 1 FROM sample s {LOG_OF_SAMPLE}
+    WHERE s.dataset_version = sample_annotation.dataset_version AND s.token = sample_annotation.sample_token
+      AND l.location = %s)"""
+EGO_POSE_IN_LOCATION = f"""EXISTS (SELECT 1 FROM sample_data sd
+    JOIN sample s ON s.dataset_version = sd.dataset_version AND s.token = sd.sample_token {LOG_OF_SAMPLE}
+    WHERE sd.dataset_version = ego_pose.dataset_version AND sd.ego_pose_token = ego_pose.token
+      AND l.location = %s)"""
+ANNOTATION_LOCATION = f"""(SELECT l.location FROM sample s {LOG_OF_SAMPLE}
+    WHERE s.dataset_version = sample_annotation.dataset_version AND s.token = sample_annotation.sample_token)"""
+EGO_POSE_LOCATION = f"""(SELECT l.location FROM sample_data sd
+    JOIN sample s ON s.dataset_version = sd.dataset_version AND s.token = sd.sample_token {LOG_OF_SAMPLE}
+    WHERE sd.dataset_version = ego_pose.dataset_version AND sd.ego_pose_token = ego_pose.token LIMIT 1)"""
+
+# Access paths of api.py and nuscenetool.py and the index each must use:
+# (description, table, query, parameter expressions, (index method, indexed
+# column, None for an expression index[, index name]). The parameters are
+# read from one row of the table. With a name, the index (or, on a
+# partition, its parent) must be that one.
+CHECKS = [
+    ("API GET /samples/{token}", 'sample',
+     "SELECT * FROM sample WHERE dataset_version = %s AND token = %s",
+     "dataset_version, token", ('btree', 'token')),
+    ("API GET /sample_data?cursor= (keyset page)", 'sample_data',
+     "SELECT * FROM sample_data WHERE dataset_version = %s AND token > %s ORDER BY token LIMIT 101",
+     "dataset_version, token", ('btree', 'token')),
+    ("API GET /instances?category_token=", 'instance',
+     "SELECT * FROM instance WHERE dataset_version = %s AND category_token = %s",
+     "dataset_version, category_token", ('btree', 'category_token')),
+    ("API GET /scenes?log_token=", 'scenes',
+     "SELECT * FROM scenes WHERE dataset_version = %s AND log_token = %s",
+     "dataset_version, log_token", ('btree', 'log_token')),
+    ("API GET /samples?scene_token=", 'sample',
+     "SELECT * FROM sample WHERE dataset_version = %s AND scene_token = %s",
+     "dataset_version, scene_token", ('btree', 'scene_token')),
+    ("API GET /samples?timestamp_from=&timestamp_to=", 'sample',
+     "SELECT * FROM sample WHERE dataset_version = %s AND timestamp >= %s AND timestamp <= %s",
+     "dataset_version, timestamp, timestamp + 1000000", ('brin', 'timestamp')),
+    ("API GET /calibrated_sensors?sensor_token=", 'calibrated_sensor',
+     "SELECT * FROM calibrated_sensor WHERE dataset_version = %s AND sensor_token = %s",
+     "dataset_version, sensor_token", ('btree', 'sensor_token')),
+    ("API GET /sample_data?sample_token=", 'sample_data',
+     "SELECT * FROM sample_data WHERE dataset_version = %s AND sample_token = %s",
+     "dataset_version, sample_token", ('btree', 'sample_token')),
+    ("API GET /sample_data?calibrated_sensor_token=", 'sample_data',
+     "SELECT * FROM sample_data WHERE dataset_version = %s AND calibrated_sensor_token = %s",
+     "dataset_version, calibrated_sensor_token", ('btree', 'calibrated_sensor_token')),
+    ("API GET /sample_data?timestamp_from=&timestamp_to=", 'sample_data',
+     "SELECT * FROM sample_data WHERE dataset_version = %s AND timestamp >= %s AND timestamp <= %s",
+     "dataset_version, timestamp, timestamp + 1000000", ('brin', 'timestamp')),
+    ("API GET /ego_poses?timestamp_from=&timestamp_to=", 'ego_pose',
+     "SELECT * FROM ego_pose WHERE dataset_version = %s AND timestamp >= %s AND timestamp <= %s",
+     "dataset_version, timestamp, timestamp + 1000000", ('brin', 'timestamp')),
+    ("API GET /sample_annotations?sample_token=", 'sample_annotation',
+     "SELECT * FROM sample_annotation WHERE dataset_version = %s AND sample_token = %s",
+     "dataset_version, sample_token", ('btree', 'sample_token')),
+    ("API GET /sample_annotations?instance_token=", 'sample_annotation',
+     "SELECT * FROM sample_annotation WHERE dataset_version = %s AND instance_token = %s",
+     "dataset_version, instance_token", ('btree', 'instance_token')),
+    # The list filters, as api.py's where() and fetch_page() send them
+    ("API GET /sample_data?is_key_frame=true", 'sample_data',
+     "SELECT * FROM sample_data WHERE dataset_version = %s AND is_key_frame = %s ORDER BY token LIMIT 101",
+     "dataset_version, true", ('btree', 'token', 'sample_data_key_frame_page_idx')),
+    ("API GET /sample_data?is_key_frame=true&cursor=", 'sample_data',
+     "SELECT * FROM sample_data WHERE dataset_version = %s AND is_key_frame = %s AND token > %s ORDER BY token LIMIT 101",
+     "dataset_version, true, token", ('btree', 'token', 'sample_data_key_frame_page_idx')),
+    ("API GET /sample_annotations?visibility=", 'sample_annotation',
+     "SELECT * FROM sample_annotation WHERE dataset_version = %s AND visibility_token = "
+     "(SELECT token FROM visibility WHERE dataset_version = %s AND level = %s) ORDER BY token LIMIT 101",
+     "dataset_version, dataset_version, (SELECT v.level FROM visibility v WHERE v.dataset_version = "
+     "sample_annotation.dataset_version AND v.token = sample_annotation.visibility_token)",
+     ('btree', 'visibility_token', 'sample_annotation_visibility_page_idx')),
+    # Low thresholds match most rows and rightly read the primary key in
+    # token order; the index serves selective ones
+    ("API GET /sample_annotations?min_num_lidar_pts= (selective)", 'sample_annotation',
+     "SELECT * FROM sample_annotation WHERE dataset_version = %s AND num_lidar_pts >= %s ORDER BY token LIMIT 101",
+     "dataset_version, (SELECT max(s.num_lidar_pts) FROM sample_annotation s "
+     "WHERE s.dataset_version = sample_annotation.dataset_version)",
+     ('btree', 'num_lidar_pts', 'sample_annotation_num_lidar_pts_idx')),
+    ("API GET /lidarsegs?sample_data_token=", 'lidarseg',
+     "SELECT * FROM lidarseg WHERE dataset_version = %s AND sample_data_token = %s",
+     "dataset_version, sample_data_token", ('btree', 'sample_data_token')),
+    ("API GET /spatial/sample_annotations/radius", 'sample_annotation',
+     f"SELECT * FROM sample_annotation WHERE dataset_version = %s AND {POSITION} <@ circle(point(%s, %s), %s) "
+     f"AND {ANNOTATION_IN_LOCATION} ORDER BY {POSITION} <-> point(%s, %s) LIMIT 100",
+     f"dataset_version, translation[1], translation[2], 10.0, {ANNOTATION_LOCATION}, translation[1], translation[2]",
+     ('gist', None)),
+    ("API GET /spatial/sample_annotations/nearest", 'sample_annotation',
+     f"SELECT * FROM sample_annotation WHERE dataset_version = %s AND {ANNOTATION_IN_LOCATION} "
+     f"ORDER BY {POSITION} <-> point(%s, %s) LIMIT 10",
+     f"dataset_version, {ANNOTATION_LOCATION}, translation[1], translation[2]", ('gist', None)),
+    ("API GET /spatial/ego_poses/box", 'ego_pose',
+     f"SELECT * FROM ego_pose WHERE dataset_version = %s AND {POSITION} <@ box(point(%s, %s), point(%s, %s)) "
+     f"AND {EGO_POSE_IN_LOCATION} ORDER BY token LIMIT 100",
+     f"dataset_version, translation[1] - 10, translation[2] - 10, translation[1] + 10, translation[2] + 10, "
+     f"{EGO_POSE_LOCATION}", ('gist', None)),
+    ("GUI delete record", 'sample_data',
+     "DELETE FROM sample_data WHERE token = %s AND dataset_version = %s",
+     "token, dataset_version", ('btree', 'token')),
+    ("GUI update record", 'sample_annotation',
+     "UPDATE sample_annotation SET num_lidar_pts = num_lidar_pts WHERE token = %s AND dataset_version = %s",
+     "token, dataset_version", ('btree', 'token')),
+]
+
+
+# A BRIN range covers 128 pages; below this many rows a B-tree scan is
+# cheaper and the planner rightly prefers it, so time range checks are skipped
+BRIN_MIN_ROWS = 10000
+
+
+def get_db_connection():
+    return psycopg2.connect(
+        host=os.getenv('DB_HOST'),
+        database=os.getenv('DB_NAME'),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        port=os.getenv('DB_PORT')
+    )
+
+
+def migrate(connection):
+    """Apply the migrations missing from schema_migrations, each in its own
+    transaction. Returns the ids that were applied."""
+    cursor = connection.cursor()
+    applied = []
+    try:
+        cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            id VARCHAR(255) PRIMARY KEY,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """)
+        cursor.execute("SELECT id FROM schema_migrations")
+        done = {row[0] for row in cursor.fetchall()}
+        connection.commit()
+
+        for migration_id, statements in MIGRATIONS:
+            if migration_id in done:
+                continue
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute("INSERT INTO schema_migrations (id) VALUES (%s)", (migration_id,))
+            connection.commit()
+            applied.append(migration_id)
+            event('migration_applied', f"Applied migration {migration_id}", migration=migration_id)
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return applied
+
+
+def plan_indexes(plan):
+    """Names of the indexes used anywhere in an EXPLAIN (FORMAT JSON) plan."""
+    names = []
+    if 'Index Name' in plan:
+        names.append(plan['Index Name'])
+    for child in plan.get('Plans', []):
+        names.extend(plan_indexes(child))
+    return names
+
+
+def check_access_paths(connection, version):
+    """EXPLAIN every entry of CHECKS and report whether it uses its index.
+
+    This is a manual check against a loaded database (``--check VERSION``,
+    or tests/test_access_paths.py when DB_* is configured). Sequential scans
+    are disabled for it: on the mini and test datasets they are cheaper
+    than any index, so the planner would pick them whatever the indexes.
+    A pass therefore shows that the index can answer the exact SQL the API
+    sends (its predicate, order and limit match the index definition), not
+    that the planner picks it for every dataset size. Tables are analyzed
+    first; everything runs in one transaction that is rolled back. Returns
+    the failed descriptions.
+    """
+    cursor = connection.cursor()
+    failed = []
+    try:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        for table in sorted({check[1] for check in CHECKS}):
+            cursor.execute(f"ANALYZE {table}")
+
+        for description, table, query, parameters, (method, column, *name) in CHECKS:
+            cursor.execute(f"SELECT {parameters} FROM {table} WHERE dataset_version = %s LIMIT 1", (version,))
+            row = cursor.fetchone()
+            if row is None:
+                event('access_path_skipped', f"SKIP {description}: no {table} rows in {version}",
+                      check=description)
+                continue
+            if method == 'brin':
+                cursor.execute(f"SELECT count(*) FROM {table} WHERE dataset_version = %s", (version,))
+                rows = cursor.fetchone()[0]
+                if rows < BRIN_MIN_ROWS:
+                    event('access_path_skipped',
+                          f"SKIP {description}: {rows} {table} rows in {version} is too few for BRIN",
+                          check=description)
+                    continue
+
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {query}", row)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            indexes = plan_indexes(plan[0]['Plan'])
+            cursor.execute("""
+            SELECT i.relname FROM pg_class i
+            JOIN pg_am am ON am.oid = i.relam
+            JOIN pg_index x ON x.indexrelid = i.oid
+            WHERE i.relname = ANY(%s) AND am.amname = %s
+              AND (%s::text IS NULL OR EXISTS (
+                  SELECT 1 FROM pg_attribute a
+                  WHERE a.attrelid = x.indrelid AND a.attnum = ANY(x.indkey) AND a.attname = %s))
+              AND (%s::text IS NULL OR i.relname = %s OR EXISTS (
+                  SELECT 1 FROM pg_inherits h JOIN pg_class p ON p.oid = h.inhparent
+                  WHERE h.inhrelid = i.oid AND p.relname = %s))
+            """, (indexes, method, column, column, *(name or [None]) * 3))
+            matching = [index for index, in cursor.fetchall()]
+            if matching:
+                event('access_path_ok', f"OK   {description}: {', '.join(matching)}",
+                      check=description, indexes=matching)
+            else:
+                failed.append(description)
+                expected = name[0] if name else f"a {method} index on {column or 'the position'}"
+                event('access_path_failed',
+                      f"FAIL {description}: expected {expected}, plan uses {', '.join(indexes) or 'no index'}",
+                      level=logging.WARNING, check=description, indexes=indexes)
+    finally:
+        connection.rollback()
+        cursor.close()
+    return failed
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Apply schema migrations to the nuScenes database")
+    parser.add_argument('--check', metavar='VERSION',
+                        help="instead of migrating, EXPLAIN the API and GUI queries on VERSION "
+                             "and fail unless they use the indexes")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    configure_logging()
+    connection = get_db_connection()
+    try:
+        if args.check:
+            failed = check_access_paths(connection, args.check)
+            if failed:
+                event('access_paths_failed', f"{len(failed)} access paths do not use their index",
+                      level=logging.ERROR, failed=failed)
+                sys.exit(1)
+        else:
+            applied = migrate(connection)
+            if not applied:
+                event('schema_up_to_date', "Schema is up to date")
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,159 +1,215 @@
--- First drop dependent tables (in reverse order of dependencies)
-DROP TABLE IF EXISTS lidarseg CASCADE;
-DROP TABLE IF EXISTS map CASCADE;
-DROP TABLE IF EXISTS sample_annotation CASCADE;
-DROP TABLE IF EXISTS sample_data CASCADE;
-DROP TABLE IF EXISTS calibrated_sensor CASCADE;
-DROP TABLE IF EXISTS ego_pose CASCADE;
-DROP TABLE IF EXISTS sample CASCADE;
-DROP TABLE IF EXISTS scenes CASCADE;
-DROP TABLE IF EXISTS instance CASCADE;
-
--- Then drop independent tables
-DROP TABLE IF EXISTS category CASCADE;
-DROP TABLE IF EXISTS attribute CASCADE;
-DROP TABLE IF EXISTS visibility CASCADE;
-DROP TABLE IF EXISTS sensor CASCADE;
-DROP TABLE IF EXISTS log CASCADE;
+-- Tables are created only when missing so that unchanged data survives a
+-- restart; dbconnect.py drops them first when NUSCENES_RESET=1
+--
+-- Every table carries a dataset_version column ('v1.0-mini', 'v1.0-trainval',
+-- ...) so several nuScenes releases can live side by side. Tokens are only
+-- unique within a version (mini is a subset of trainval), so primary and
+-- foreign keys include it. The large tables are list-partitioned by version;
+-- dbconnect.py creates, attaches and detaches one partition per version.
+--
+-- Geometry is stored as fixed-length float8 arrays in nuScenes order:
+-- translation (x, y, z) in meters, rotation as a quaternion (w, x, y, z),
+-- size (width, length, height) in meters. Elements are addressed 1-based,
+-- e.g. translation[1] is x.
+--
+-- Tokens are 32 hex digit strings and stored as uuid (16 bytes), which
+-- PostgreSQL accepts in that form; dbconnect.py and api.py read them back
+-- without dashes. Visibility tokens are '1' to '4' and stay text.
+
+-- Load checkpoints written by dbconnect.py, one row per loaded table
+CREATE TABLE IF NOT EXISTS load_manifest (
+    dataset_version VARCHAR(32) NOT NULL,
+    table_name VARCHAR(255) NOT NULL,
+    source_hash VARCHAR(64) NOT NULL,
+    row_count BIGINT NOT NULL,
+    loaded_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (dataset_version, table_name)
+);
+
+-- Foreign keys and indexes dropped by a fast load (NUSCENES_FAST_LOAD=1),
+-- kept until dbconnect.py has rebuilt them
+CREATE TABLE IF NOT EXISTS load_deferred_ddl (
+    table_name VARCHAR(255) NOT NULL,
+    object_name VARCHAR(255) NOT NULL,
+    kind VARCHAR(16) NOT NULL,
+    definition TEXT NOT NULL,
+    PRIMARY KEY (table_name, object_name)
+);
+
+-- Source rows left out of a load (VALIDATION_MODE=quarantine) because they
+-- break a foreign key or repeat a token
+CREATE TABLE IF NOT EXISTS load_quarantine (
+    dataset_version VARCHAR(32) NOT NULL,
+    table_name VARCHAR(255) NOT NULL,
+    token VARCHAR(255),
+    reason TEXT NOT NULL,
+    record JSONB NOT NULL,
+    quarantined_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
 
 -- Independent tables
-CREATE TABLE log (
-    token VARCHAR(255) PRIMARY KEY,
+CREATE TABLE IF NOT EXISTS log (
+    token UUID,
     logfile VARCHAR(255),
     vehicle VARCHAR(255),
     date_captured DATE,
-    location VARCHAR(255)
+    location VARCHAR(255),
+    dataset_version VARCHAR(32) NOT NULL,
+    PRIMARY KEY (dataset_version, token)
 );
 
-CREATE TABLE sensor (
-    token VARCHAR(255) PRIMARY KEY,
+CREATE TABLE IF NOT EXISTS sensor (
+    token UUID,
     channel VARCHAR(255),
-    modality VARCHAR(50)
+    modality VARCHAR(50),
+    dataset_version VARCHAR(32) NOT NULL,
+    PRIMARY KEY (dataset_version, token)
 );
 
-CREATE TABLE visibility (
-    token VARCHAR(255) PRIMARY KEY,
+CREATE TABLE IF NOT EXISTS visibility (
+    token VARCHAR(255),
     level VARCHAR(50),
-    description TEXT
+    description TEXT,
+    dataset_version VARCHAR(32) NOT NULL,
+    PRIMARY KEY (dataset_version, token)
 );
 
-CREATE TABLE attribute (
-    token VARCHAR(255) PRIMARY KEY,
+CREATE TABLE IF NOT EXISTS attribute (
+    token UUID,
     name VARCHAR(255),
-    description TEXT
+    description TEXT,
+    dataset_version VARCHAR(32) NOT NULL,
+    PRIMARY KEY (dataset_version, token)
 );
 
-CREATE TABLE category (
-    token VARCHAR(255) PRIMARY KEY,
+CREATE TABLE IF NOT EXISTS category (
+    token UUID,
     name VARCHAR(255),
     description TEXT,
-    index INT
+    index INT,
+    dataset_version VARCHAR(32) NOT NULL,
+    PRIMARY KEY (dataset_version, token)
 );
 
 -- Dependent tables
-CREATE TABLE instance (
-    token VARCHAR(255) PRIMARY KEY,
-    category_token VARCHAR(255),
+CREATE TABLE IF NOT EXISTS instance (
+    token UUID,
+    category_token UUID,
     nbr_annotations INT,
-    first_annotation_token VARCHAR(255),
-    last_annotation_token VARCHAR(255),
-    FOREIGN KEY (category_token) REFERENCES category(token)
+    first_annotation_token UUID,
+    last_annotation_token UUID,
+    dataset_version VARCHAR(32) NOT NULL,
+    PRIMARY KEY (dataset_version, token),
+    FOREIGN KEY (dataset_version, category_token) REFERENCES category(dataset_version, token)
 );
 
-CREATE TABLE scenes (
-    scene_token VARCHAR(255) PRIMARY KEY,
+CREATE TABLE IF NOT EXISTS scenes (
+    scene_token UUID,
     name VARCHAR(255),
     description TEXT,
-    log_token VARCHAR(255),
+    log_token UUID,
     nbr_samples INT,
-    first_sample_token VARCHAR(255),
-    last_sample_token VARCHAR(255),
-    FOREIGN KEY (log_token) REFERENCES log(token)
+    first_sample_token UUID,
+    last_sample_token UUID,
+    dataset_version VARCHAR(32) NOT NULL,
+    PRIMARY KEY (dataset_version, scene_token),
+    FOREIGN KEY (dataset_version, log_token) REFERENCES log(dataset_version, token)
 );
 
-CREATE TABLE sample (
-    token VARCHAR(255) PRIMARY KEY,
+CREATE TABLE IF NOT EXISTS sample (
+    token UUID,
     timestamp BIGINT,
-    scene_token VARCHAR(255),
-    next VARCHAR(255),
-    prev VARCHAR(255),
-    FOREIGN KEY (scene_token) REFERENCES scenes(scene_token),
-    FOREIGN KEY (next) REFERENCES sample(token),
-    FOREIGN KEY (prev) REFERENCES sample(token)
+    scene_token UUID,
+    next UUID,
+    prev UUID,
+    dataset_version VARCHAR(32) NOT NULL,
+    PRIMARY KEY (dataset_version, token),
+    FOREIGN KEY (dataset_version, scene_token) REFERENCES scenes(dataset_version, scene_token),
+    -- Linked-list pointers are checked at commit so rows can be loaded in one pass
+    FOREIGN KEY (dataset_version, next) REFERENCES sample(dataset_version, token) DEFERRABLE INITIALLY DEFERRED,
+    FOREIGN KEY (dataset_version, prev) REFERENCES sample(dataset_version, token) DEFERRABLE INITIALLY DEFERRED
 );
 
 
-CREATE TABLE ego_pose (
-    token VARCHAR(255) PRIMARY KEY,
-    translation JSONB,
-    rotation JSONB,
-    timestamp BIGINT
-);
-
-CREATE TABLE calibrated_sensor (
-    token VARCHAR(255) PRIMARY KEY,
-    sensor_token VARCHAR(255),
-    translation JSONB,
-    rotation JSONB,
-    camera_intrinsic JSONB,
-    FOREIGN KEY (sensor_token) REFERENCES sensor(token)
+CREATE TABLE IF NOT EXISTS ego_pose (
+    token UUID,
+    translation DOUBLE PRECISION[] CHECK (cardinality(translation) = 3),
+    rotation DOUBLE PRECISION[] CHECK (cardinality(rotation) = 4),
+    timestamp BIGINT,
+    dataset_version VARCHAR(32) NOT NULL,
+    PRIMARY KEY (dataset_version, token)
+) PARTITION BY LIST (dataset_version);
+
+CREATE TABLE IF NOT EXISTS calibrated_sensor (
+    token UUID,
+    sensor_token UUID,
+    translation DOUBLE PRECISION[] CHECK (cardinality(translation) = 3),
+    rotation DOUBLE PRECISION[] CHECK (cardinality(rotation) = 4),
+    -- 3x3 matrix for cameras, NULL for lidar and radar
+    camera_intrinsic DOUBLE PRECISION[][] CHECK (cardinality(camera_intrinsic) = 9),
+    dataset_version VARCHAR(32) NOT NULL,
+    PRIMARY KEY (dataset_version, token),
+    FOREIGN KEY (dataset_version, sensor_token) REFERENCES sensor(dataset_version, token)
 );
 
-CREATE TABLE sample_data (
-    token VARCHAR(255) PRIMARY KEY,
-    sample_token VARCHAR(255),
-    ego_pose_token VARCHAR(255),
-    calibrated_sensor_token VARCHAR(255),
+CREATE TABLE IF NOT EXISTS sample_data (
+    token UUID,
+    sample_token UUID,
+    ego_pose_token UUID,
+    calibrated_sensor_token UUID,
     timestamp BIGINT,
     fileformat VARCHAR(255),
     is_key_frame BOOLEAN,
     height INTEGER,
     width INTEGER,
     filename TEXT,
-    prev VARCHAR(255),
-    next VARCHAR(255),
-    FOREIGN KEY (sample_token) REFERENCES sample(token),
-    FOREIGN KEY (ego_pose_token) REFERENCES ego_pose(token),
-    FOREIGN KEY (calibrated_sensor_token) REFERENCES calibrated_sensor(token)
-);
-
--- Add the next foreign key constraint after all data is inserted
-ALTER TABLE sample_data 
-    ADD CONSTRAINT sample_data_next_fkey 
-    FOREIGN KEY (next) 
-    REFERENCES sample_data(token) 
-    DEFERRABLE INITIALLY DEFERRED;
-
-CREATE TABLE sample_annotation (
-    token VARCHAR(255) PRIMARY KEY,
-    sample_token VARCHAR(255),
-    instance_token VARCHAR(255),
+    prev UUID,
+    next UUID,
+    dataset_version VARCHAR(32) NOT NULL,
+    PRIMARY KEY (dataset_version, token),
+    FOREIGN KEY (dataset_version, sample_token) REFERENCES sample(dataset_version, token),
+    FOREIGN KEY (dataset_version, ego_pose_token) REFERENCES ego_pose(dataset_version, token),
+    FOREIGN KEY (dataset_version, calibrated_sensor_token) REFERENCES calibrated_sensor(dataset_version, token),
+    FOREIGN KEY (dataset_version, next) REFERENCES sample_data(dataset_version, token) DEFERRABLE INITIALLY DEFERRED
+) PARTITION BY LIST (dataset_version);
+
+CREATE TABLE IF NOT EXISTS sample_annotation (
+    token UUID,
+    sample_token UUID,
+    instance_token UUID,
     visibility_token VARCHAR(255),
-    translation JSONB,
-    size JSONB,
-    rotation JSONB,
+    translation DOUBLE PRECISION[] CHECK (cardinality(translation) = 3),
+    size DOUBLE PRECISION[] CHECK (cardinality(size) = 3),
+    rotation DOUBLE PRECISION[] CHECK (cardinality(rotation) = 4),
     num_lidar_pts INT,
     num_radar_pts INT,
-    next VARCHAR(255),
-    prev VARCHAR(255),
-    FOREIGN KEY (sample_token) REFERENCES sample(token),
-    FOREIGN KEY (instance_token) REFERENCES instance(token),
-    FOREIGN KEY (visibility_token) REFERENCES visibility(token),
-    FOREIGN KEY (next) REFERENCES sample_annotation(token),
-    FOREIGN KEY (prev) REFERENCES sample_annotation(token)
-);
-
-CREATE TABLE lidarseg (
-    token VARCHAR(255) PRIMARY KEY,
+    next UUID,
+    prev UUID,
+    dataset_version VARCHAR(32) NOT NULL,
+    PRIMARY KEY (dataset_version, token),
+    FOREIGN KEY (dataset_version, sample_token) REFERENCES sample(dataset_version, token),
+    FOREIGN KEY (dataset_version, instance_token) REFERENCES instance(dataset_version, token),
+    FOREIGN KEY (dataset_version, visibility_token) REFERENCES visibility(dataset_version, token),
+    FOREIGN KEY (dataset_version, next) REFERENCES sample_annotation(dataset_version, token) DEFERRABLE INITIALLY DEFERRED,
+    FOREIGN KEY (dataset_version, prev) REFERENCES sample_annotation(dataset_version, token) DEFERRABLE INITIALLY DEFERRED
+) PARTITION BY LIST (dataset_version);
+
+-- Partitioned as well: it references sample_data, and a version's
+-- partitions can only be detached together with everything pointing at them
+CREATE TABLE IF NOT EXISTS lidarseg (
+    token UUID,
     filename VARCHAR(255),
-    sample_data_token VARCHAR(255),
-    FOREIGN KEY (sample_data_token) REFERENCES sample_data(token)
-);
-
-CREATE TABLE map (
-    token VARCHAR(255) PRIMARY KEY,
-    log_tokens TEXT[],
+    sample_data_token UUID,
+    dataset_version VARCHAR(32) NOT NULL,
+    PRIMARY KEY (dataset_version, token),
+    FOREIGN KEY (dataset_version, sample_data_token) REFERENCES sample_data(dataset_version, token)
+) PARTITION BY LIST (dataset_version);
+
+CREATE TABLE IF NOT EXISTS map (
+    token UUID,
+    log_tokens UUID[],
     category VARCHAR(255),
-    filename VARCHAR(255)
+    filename VARCHAR(255),
+    dataset_version VARCHAR(32) NOT NULL,
+    PRIMARY KEY (dataset_version, token)
 );
-
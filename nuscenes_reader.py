@@ -0,0 +1,81 @@
+import json
+import os
+import re
+
+_WHITESPACE = re.compile(r'\s*')
+# Characters that can end a bare scalar (number, true, false, null)
+_SCALAR_END = re.compile(r'[\s,\]]')
+
+
+def iter_json_array(path, chunk_size=1 << 20):
+    """Yield the elements of a top-level JSON array one at a time.
+
+    The file is read in ``chunk_size`` pieces and each element is decoded
+    as soon as it is complete, so memory use is bounded by the buffer and
+    the largest single record, not by the size of the file. Elements must
+    be separated by exactly one comma and nothing but whitespace may follow
+    the closing bracket; anything else raises ValueError.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as file:
+        buffer, pos, eof = '', 0, False
+
+        def peek():
+            """Skip whitespace, reading on at the buffer end; the next
+            character, or '' at the end of the file."""
+            nonlocal buffer, pos, eof
+            while True:
+                pos = _WHITESPACE.match(buffer, pos).end()
+                if pos < len(buffer) or eof:
+                    return buffer[pos:pos + 1]
+                buffer, pos = file.read(chunk_size), 0
+                eof = not buffer
+
+        def decode():
+            nonlocal buffer, pos, eof
+            if not peek():
+                raise ValueError(f"Unexpected end of file in {path}")
+            while True:
+                # A bare scalar (e.g. a number) cut by the buffer end would
+                # decode as a shorter value, so it is only decoded once the
+                # character ending it has been read
+                if buffer[pos] in '{["' or eof or _SCALAR_END.search(buffer, pos):
+                    try:
+                        record, pos = decoder.raw_decode(buffer, pos)
+                        return record
+                    except json.JSONDecodeError:
+                        if eof:
+                            raise
+                chunk = file.read(chunk_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+
+        if peek() != '[':
+            raise ValueError(f"{path} does not contain a JSON array")
+        pos += 1
+        if peek() == ']':
+            pos += 1
+        else:
+            while True:
+                yield decode()
+                char = peek()
+                if char == ']':
+                    pos += 1
+                    break
+                if char != ',':
+                    raise ValueError(f"Expected ',' or ']' in {path}" if char else
+                                     f"Unexpected end of file in {path}")
+                pos += 1
+                if peek() == ']':
+                    raise ValueError(f"Trailing comma in {path}")
+        if peek():
+            raise ValueError(f"Unexpected content after the JSON array in {path}")
+
+
+def table_path(dataroot, version, table):
+    return os.path.join(dataroot, version, f'{table}.json')
+
+
+def iter_table(dataroot, version, table):
+    """Stream the records of ``<dataroot>/<version>/<table>.json``."""
+    return iter_json_array(table_path(dataroot, version, table))
@@ -157,7 +157,12 @@ class CRUDApp(ctk.CTk):
             )
 
             cursor = self.connection.cursor()
-            cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = 'public';")
+            # Per-version partitions are reached through their parent table
+            cursor.execute("""
+                SELECT c.relname FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p') AND NOT c.relispartition;
+            """)
             self.tables = [table[0] for table in cursor.fetchall()]
 
             self.table_menu.configure(values=self.tables)
@@ -582,8 +587,14 @@ class CRUDApp(ctk.CTk):
             cursor.execute(f"SELECT column_name FROM information_schema.columns WHERE table_name = '{table_name}';")
             columns = [desc[0] for desc in cursor.fetchall()]
 
-            sql = f"DELETE FROM {table_name} WHERE {columns[0]} = %s;"
-            cursor.execute(sql, [values[0]])
+            # Tokens repeat across dataset versions; matching the version too
+            # deletes only the selected row and uses the primary key index
+            if 'dataset_version' in columns:
+                sql = f"DELETE FROM {table_name} WHERE {columns[0]} = %s AND dataset_version = %s;"
+                cursor.execute(sql, [values[0], values[columns.index('dataset_version')]])
+            else:
+                sql = f"DELETE FROM {table_name} WHERE {columns[0]} = %s;"
+                cursor.execute(sql, [values[0]])
             self.connection.commit()
             messagebox.showinfo("Success", f"Record deleted from {table_name} successfully!")
             self.load_table_data(table_name)
@@ -671,8 +682,12 @@ class CRUDApp(ctk.CTk):
                 cursor.execute(sql, values)
             else:
                 set_clause = ", ".join([f"{col} = %s" for col in columns])
-                sql = f"UPDATE {table_name} SET {set_clause} WHERE {columns[0]} = %s;"
-                cursor.execute(sql, values + [record_values[0]])
+                if 'dataset_version' in columns:
+                    sql = f"UPDATE {table_name} SET {set_clause} WHERE {columns[0]} = %s AND dataset_version = %s;"
+                    cursor.execute(sql, values + [record_values[0], record_values[columns.index('dataset_version')]])
+                else:
+                    sql = f"UPDATE {table_name} SET {set_clause} WHERE {columns[0]} = %s;"
+                    cursor.execute(sql, values + [record_values[0]])
             
             self.connection.commit()
             messagebox.showinfo("Success", f"Record {'created' if is_create else 'updated'} successfully!")
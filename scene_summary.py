@@ -0,0 +1,187 @@
+"""Per-scene summary tables behind the dashboard endpoints of api.py.
+
+scene_summary holds sample and annotation counts, lidar/radar point totals
+and the time span of every scene, scene_category_summary the annotation
+counts per category. Both are created by migrations.py and refreshed by
+the loader after each version it loads. Rows changed outside the loader
+(the GUI, psql, ...) queue their scene in scene_summary_stale through
+triggers, and the next refresh recomputes only those scenes:
+
+    python scene_summary.py              # refresh stale scenes of NUSCENES_VERSIONS
+    python scene_summary.py --full v1.0-mini
+"""
+import argparse
+import os
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+from load_metrics import configure_logging, event
+
+load_dotenv()
+
+versions = [v.strip() for v in os.getenv('NUSCENES_VERSIONS', 'v1.0-mini').split(',') if v.strip()]
+
+# Tables whose reload changes the summaries of every scene of a version
+SOURCE_TABLES = ('scenes', 'sample', 'sample_annotation', 'instance')
+
+# Aggregates of the scenes in the temporary table refresh_scenes
+SCENE_QUERY = """
+SELECT sc.scene_token, count(DISTINCT s.token) AS sample_count, count(sa.token) AS annotation_count,
+       coalesce(sum(sa.num_lidar_pts), 0) AS lidar_pts, coalesce(sum(sa.num_radar_pts), 0) AS radar_pts,
+       min(s.timestamp) AS first_timestamp, max(s.timestamp) AS last_timestamp
+FROM refresh_scenes r
+JOIN scenes sc ON sc.dataset_version = %(version)s AND sc.scene_token = r.scene_token
+LEFT JOIN sample s ON s.dataset_version = %(version)s AND s.scene_token = sc.scene_token
+LEFT JOIN sample_annotation sa ON sa.dataset_version = %(version)s AND sa.sample_token = s.token
+GROUP BY sc.scene_token
+"""
+
+CATEGORY_QUERY = """
+SELECT s.scene_token, i.category_token, count(*) AS annotation_count,
+       sum(sa.num_lidar_pts) AS lidar_pts, sum(sa.num_radar_pts) AS radar_pts
+FROM refresh_scenes r
+JOIN sample s ON s.dataset_version = %(version)s AND s.scene_token = r.scene_token
+JOIN sample_annotation sa ON sa.dataset_version = %(version)s AND sa.sample_token = s.token
+JOIN instance i ON i.dataset_version = %(version)s AND i.token = sa.instance_token
+GROUP BY s.scene_token, i.category_token
+"""
+
+
+def get_db_connection():
+    return psycopg2.connect(
+        host=os.getenv('DB_HOST'),
+        database=os.getenv('DB_NAME'),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        port=os.getenv('DB_PORT')
+    )
+
+
+def refresh(connection, version, full=False):
+    """Recompute the summaries of the stale and not yet summarized scenes of
+    ``version``, or of all its scenes with ``full``.
+
+    New aggregates are compared with the stored ones and only scenes whose
+    numbers changed are rewritten. Returns the number of rewritten scenes.
+    """
+    cursor = connection.cursor()
+    start = time.perf_counter()
+    try:
+        cursor.execute("CREATE TEMPORARY TABLE refresh_scenes (scene_token UUID PRIMARY KEY) ON COMMIT DROP")
+        if full:
+            cursor.execute("""
+            INSERT INTO refresh_scenes
+            SELECT scene_token FROM scenes WHERE dataset_version = %(version)s
+            UNION SELECT scene_token FROM scene_summary WHERE dataset_version = %(version)s
+            UNION SELECT scene_token FROM scene_summary_stale WHERE dataset_version = %(version)s
+            """, {'version': version})
+        else:
+            cursor.execute("""
+            INSERT INTO refresh_scenes
+            SELECT scene_token FROM scene_summary_stale WHERE dataset_version = %(version)s
+            UNION SELECT scene_token FROM scenes sc WHERE dataset_version = %(version)s AND NOT EXISTS (
+                SELECT 1 FROM scene_summary t WHERE t.dataset_version = sc.dataset_version AND t.scene_token = sc.scene_token)
+            """, {'version': version})
+        scenes = cursor.rowcount
+        if not scenes:
+            connection.commit()
+            return 0
+        cursor.execute("ANALYZE refresh_scenes")
+
+        cursor.execute(f"""
+        CREATE TEMPORARY TABLE fresh_scene ON COMMIT DROP AS {SCENE_QUERY}
+        """, {'version': version})
+        cursor.execute(f"""
+        CREATE TEMPORARY TABLE fresh_category ON COMMIT DROP AS {CATEGORY_QUERY}
+        """, {'version': version})
+
+        # Scenes that are gone or lost categories
+        cursor.execute("""
+        DELETE FROM scene_summary t USING refresh_scenes r
+        WHERE t.dataset_version = %(version)s AND t.scene_token = r.scene_token
+          AND NOT EXISTS (SELECT 1 FROM fresh_scene f WHERE f.scene_token = t.scene_token)
+        RETURNING t.scene_token
+        """, {'version': version})
+        changed = {token for token, in cursor.fetchall()}
+        cursor.execute("""
+        DELETE FROM scene_category_summary t USING refresh_scenes r
+        WHERE t.dataset_version = %(version)s AND t.scene_token = r.scene_token
+          AND NOT EXISTS (SELECT 1 FROM fresh_category f
+                          WHERE f.scene_token = t.scene_token AND f.category_token = t.category_token)
+        RETURNING t.scene_token
+        """, {'version': version})
+        changed.update(token for token, in cursor.fetchall())
+
+        cursor.execute("""
+        INSERT INTO scene_summary (dataset_version, scene_token, sample_count, annotation_count,
+                                   lidar_pts, radar_pts, first_timestamp, last_timestamp)
+        SELECT %(version)s, * FROM fresh_scene
+        ON CONFLICT (dataset_version, scene_token) DO UPDATE SET
+            sample_count = EXCLUDED.sample_count, annotation_count = EXCLUDED.annotation_count,
+            lidar_pts = EXCLUDED.lidar_pts, radar_pts = EXCLUDED.radar_pts,
+            first_timestamp = EXCLUDED.first_timestamp, last_timestamp = EXCLUDED.last_timestamp,
+            refreshed_at = now()
+        WHERE (scene_summary.sample_count, scene_summary.annotation_count, scene_summary.lidar_pts,
+               scene_summary.radar_pts, scene_summary.first_timestamp, scene_summary.last_timestamp)
+              IS DISTINCT FROM
+              (EXCLUDED.sample_count, EXCLUDED.annotation_count, EXCLUDED.lidar_pts,
+               EXCLUDED.radar_pts, EXCLUDED.first_timestamp, EXCLUDED.last_timestamp)
+        RETURNING scene_token
+        """, {'version': version})
+        changed.update(token for token, in cursor.fetchall())
+        cursor.execute("""
+        INSERT INTO scene_category_summary (dataset_version, scene_token, category_token,
+                                            annotation_count, lidar_pts, radar_pts)
+        SELECT %(version)s, * FROM fresh_category
+        ON CONFLICT (dataset_version, scene_token, category_token) DO UPDATE SET
+            annotation_count = EXCLUDED.annotation_count, lidar_pts = EXCLUDED.lidar_pts,
+            radar_pts = EXCLUDED.radar_pts
+        WHERE (scene_category_summary.annotation_count, scene_category_summary.lidar_pts,
+               scene_category_summary.radar_pts)
+              IS DISTINCT FROM (EXCLUDED.annotation_count, EXCLUDED.lidar_pts, EXCLUDED.radar_pts)
+        RETURNING scene_token
+        """, {'version': version})
+        changed.update(token for token, in cursor.fetchall())
+
+        cursor.execute("""
+        DELETE FROM scene_summary_stale t USING refresh_scenes r
+        WHERE t.dataset_version = %s AND t.scene_token = r.scene_token
+        """, (version,))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    elapsed = time.perf_counter() - start
+    event('summaries_refreshed',
+          f"Refreshed {version} scene summaries in {elapsed:.2f}s: {scenes} scenes checked, "
+          f"{len(changed)} changed",
+          version=version, scenes=scenes, changed=len(changed), full=full, seconds=round(elapsed, 3))
+    return len(changed)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Refresh the scene summary tables")
+    parser.add_argument('versions', nargs='*', metavar='VERSION',
+                        help="dataset versions to refresh (default NUSCENES_VERSIONS)")
+    parser.add_argument('--full', action='store_true',
+                        help="recompute every scene instead of the stale ones")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    configure_logging()
+    connection = get_db_connection()
+    try:
+        for version in args.versions or versions:
+            refresh(connection, version, full=args.full)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import os
+
+import psycopg2
+import pytest
+
+from migrations import check_access_paths, get_db_connection
+
+pytestmark = pytest.mark.skipif(not os.getenv('DB_NAME'), reason="no database configured (DB_*)")
+
+
+@pytest.fixture
+def connection():
+    try:
+        connection = get_db_connection()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"database not reachable: {e}")
+    yield connection
+    connection.close()
+
+
+def test_api_queries_use_their_indexes(connection):
+    """Runs ``python migrations.py --check`` on NUSCENES_CHECK_VERSION, or
+    on the first loaded version."""
+    version = os.getenv('NUSCENES_CHECK_VERSION')
+    if version is None:
+        cursor = connection.cursor()
+        cursor.execute("SELECT to_regclass('load_manifest') IS NOT NULL")
+        if cursor.fetchone()[0]:
+            cursor.execute("SELECT min(dataset_version) FROM load_manifest")
+            version = cursor.fetchone()[0]
+        connection.rollback()
+    if version is None:
+        pytest.skip("no dataset version loaded")
+    assert check_access_paths(connection, version) == []
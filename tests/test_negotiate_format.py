@@ -0,0 +1,30 @@
+import pytest
+from starlette.requests import Request
+
+from api import negotiate_format
+
+
+def request(accept):
+    headers = [(b"accept", accept.encode())] if accept is not None else []
+    return Request({"type": "http", "headers": headers})
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, "json"),
+    ("", "json"),
+    ("text/csv", "csv"),
+    ("application/json, text/csv;q=0.1", "json"),
+    ("text/csv;q=0.1, application/json", "json"),
+    ("text/csv;q=0.5, application/x-ndjson;q=0.8", "ndjson"),
+    ("text/csv;q=0, application/msgpack;q=0", "json"),
+    ("application/x-ndjsonish", "json"),
+    ("text/csv;q=0.5, */*;q=0.9", "json"),
+    ("TEXT/CSV", "csv"),
+    ("text/csv, application/x-ndjson", "csv"),
+])
+def test_accept(accept, expected):
+    assert negotiate_format(request(accept)) == expected
+
+
+def test_format_parameter_wins():
+    assert negotiate_format(request("text/csv"), "arrow") == "arrow"
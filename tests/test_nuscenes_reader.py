@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from nuscenes_reader import iter_json_array
+
+
+def read(tmp_path, text, chunk_size):
+    path = tmp_path / "table.json"
+    path.write_text(text)
+    return list(iter_json_array(str(path), chunk_size))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1 << 20])
+@pytest.mark.parametrize("text", [
+    '[1.5e10, -3]',
+    '[]',
+    ' [ {"token": "a", "size": [1, 2]} , "x,]", true, null ]\n',
+])
+def test_matches_json_loads(tmp_path, text, chunk_size):
+    assert read(tmp_path, text, chunk_size) == json.loads(text)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1 << 20])
+@pytest.mark.parametrize("text", [
+    '[1, 2,]',
+    '[1, 2] 3',
+    '[1 2]',
+    '[1,, 2]',
+    '[1, 2',
+])
+def test_rejects_malformed_arrays(tmp_path, text, chunk_size):
+    with pytest.raises(ValueError):
+        read(tmp_path, text, chunk_size)